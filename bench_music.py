@@ -0,0 +1,458 @@
+"""
+Load benchmark for the music player.
+
+Drives MusicManager/MusicPlayer across N simulated guilds to see how many
+concurrent streams one process can sustain. Every guild gets a fake voice
+client that runs discord.py's real AudioPlayer thread, and plays a
+synthetic tone that ffmpeg generates up front and reads back over a local
+HTTP server, so nothing touches Discord or the internet.
+
+For every guild count it reports CPU per stream (the bot process plus its
+ffmpeg children), event loop lag, thread count, memory, and how close each
+stream kept to real time. Needs ffmpeg on the PATH, and libopus for the PCM
+path to include the opus encode the real voice client does.
+
+Run: `python bench_music.py --guilds 1 10 25 50 --path pcm`
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import discord
+from discord.player import AudioPlayer
+
+from cogs.Music.music_cache import normalize_query
+from cogs.Music.music_manager import MusicManager
+from cogs.Music.music_queue import QueueEntry
+from utils.database import Database
+from utils.migrations import migrate
+
+
+BENCH_QUERY = 'bench tone'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+class FakeMember:
+    def __init__(self, id):
+        self.id = id
+        self.display_name = f'listener-{id}'
+        self.bot = False
+
+
+class FakeMessage:
+    _next_id = 1
+
+    def __init__(self, channel):
+        self.id = FakeMessage._next_id
+        FakeMessage._next_id += 1
+        self.channel = channel
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        self.edits += 1
+        return self
+
+    async def delete(self):
+        pass
+
+
+class FakeTextChannel:
+    def __init__(self, guild):
+        self.id = guild.id * 10 + 1
+        self.guild = guild
+
+    async def send(self, *args, **kwargs):
+        return FakeMessage(self)
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild):
+        self.id = guild.id * 10 + 2
+        self.guild = guild
+        self.members = [FakeMember(guild.id)]
+
+
+class FakeGuild:
+    def __init__(self, id):
+        self.id = id
+        self.name = f'bench-{id}'
+        self.voice_client = None
+        self.text_channel = FakeTextChannel(self)
+        self.voice_channel = FakeVoiceChannel(self)
+
+    def get_channel(self, channel_id):
+        for channel in (self.text_channel, self.voice_channel):
+            if channel.id == channel_id:
+                return channel
+        return None
+
+    def get_member(self, member_id):
+        return None
+
+
+class FakeVoiceWebSocket:
+    async def speak(self, state):
+        pass
+
+
+class FakeVoiceClient:
+    """
+    Stands in for discord.VoiceClient.
+
+    Playback runs on discord.py's own AudioPlayer thread, so reading the
+    source, pacing frames and encoding PCM to opus cost what they would in
+    production. Packets are counted instead of encrypted and sent.
+    """
+
+    def __init__(self, bot, guild):
+        self.client = bot
+        self.guild = guild
+        self.channel = guild.voice_channel
+        self.ws = FakeVoiceWebSocket()
+        self.timeout = 10
+        self.encoder = None
+        self.packets = 0
+        self._player = None
+
+    def is_connected(self):
+        return True
+
+    def wait_until_connected(self, timeout=None):
+        return True
+
+    def play(self, source, *, after=None):
+        if self.is_playing():
+            raise discord.ClientException('Already playing audio.')
+        if not source.is_opus() and self.encoder is None:
+            try:
+                self.encoder = discord.opus.Encoder()
+            except discord.opus.OpusNotLoaded:
+                # still paced and counted, just without the encode cost
+                self.encoder = False
+        self._player = AudioPlayer(source, self, after=after)
+        self._player.start()
+
+    def send_audio_packet(self, data, encode=True):
+        if encode and self.encoder:
+            data = self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME)
+        self.packets += 1
+
+    def is_playing(self):
+        return self._player is not None and self._player.is_playing()
+
+    def is_paused(self):
+        return self._player is not None and self._player.is_paused()
+
+    def pause(self):
+        if self._player:
+            self._player.pause()
+
+    def resume(self):
+        if self._player:
+            self._player.resume()
+
+    def stop(self):
+        if self._player:
+            self._player.stop()
+            self._player = None
+
+    @property
+    def source(self):
+        return self._player.source if self._player else None
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+        self.guild.voice_client = None
+
+
+class FakeBot:
+    def __init__(self, config, data_dir):
+        self.config = config
+        self.data_dir = data_dir
+        self.db = Database(data_dir / 'server_stats.db', config)
+        self.log = logging.getLogger('bench')
+        self.loop = None
+        self.guilds = []
+
+    @property
+    def voice_clients(self):
+        return [guild.voice_client for guild in self.guilds if guild.voice_client]
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files with open-ended byte ranges, which ffmpeg uses to probe and seek."""
+
+    def send_head(self):
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if not match:
+            return super().send_head()
+
+        path = self.translate_path(self.path)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(404)
+            return None
+        size = os.fstat(f.fileno()).st_size
+        start = min(int(match.group(1)), size)
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+        self.send_header('Content-Length', str(size - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        return f
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # ffmpeg hangs up mid-response whenever a track is stopped
+        pass
+
+
+def serve_directory(directory):
+    """Serves a directory over HTTP on localhost, returning the server and its base URL."""
+    handler = functools.partial(QuietHandler, directory=str(directory))
+    server = QuietServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def make_tone(directory, seconds):
+    """Renders a 48kHz stereo sine tone with ffmpeg, as opus like most YouTube audio."""
+    path = directory / 'tone.opus'
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi',
+                    '-i', f'sine=frequency=440:sample_rate=48000:duration={seconds}',
+                    '-ac', '2', '-c:a', 'libopus', '-b:a', '128k', str(path)], check=True)
+    return path
+
+
+def read_proc(pid, name):
+    try:
+        with open(f'/proc/{pid}/{name}') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def process_cpu(pid):
+    """Returns the CPU seconds a process has used, or 0 when /proc can't tell us."""
+    stat = read_proc(pid, 'stat')
+    if not stat:
+        return 0
+    # the command name can contain spaces, so split after its closing paren
+    fields = stat.rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def process_rss(pid):
+    """Returns a process's resident memory in bytes, or 0 when /proc can't tell us."""
+    status = read_proc(pid, 'status') or ''
+    for line in status.splitlines():
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1]) * 1024
+    return 0
+
+
+def ffmpeg_pids(guilds):
+    pids = []
+    for guild in guilds:
+        source = guild.voice_client.source if guild.voice_client else None
+        source = getattr(source, 'original', source)
+        process = getattr(source, '_process', None)
+        if process and process.poll() is None:
+            pids.append(process.pid)
+    return pids
+
+
+async def probe_loop_lag(samples, stop, interval=0.01):
+    """Measures how late the event loop wakes up from short sleeps."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+def opus_available():
+    try:
+        discord.opus.Encoder()
+    except discord.opus.OpusNotLoaded:
+        return False
+    return True
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0
+
+
+async def run_level(bot, guild_count, args, volume):
+    """Starts playback in `guild_count` guilds and measures them for a while."""
+    manager = MusicManager(bot)
+    manager.resolver.cache.put(normalize_query(BENCH_QUERY), bot.track_info)
+    guilds = [FakeGuild(1000 + index) for index in range(guild_count)]
+    bot.guilds = guilds
+
+    started = time.perf_counter()
+    requests = []
+    for guild in guilds:
+        guild.voice_client = FakeVoiceClient(bot, guild)
+        player = await manager.get_player(guild)
+        listener = guild.voice_channel.members[0]
+        entries = [QueueEntry(BENCH_QUERY, 1.0, listener, guild.text_channel)
+                   for _ in range(args.queue + 1)]
+        requests.append(player.call(player.request, guild.text_channel,
+                                    guild.voice_client, entries[0], volume))
+        for entry in entries[1:]:
+            requests.append(player.call(player.enqueue, entry))
+    await asyncio.gather(*requests)
+    startup = time.perf_counter() - started
+
+    await asyncio.sleep(args.warmup)
+
+    lag_samples = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(lag_samples, stop))
+    pids = ffmpeg_pids(guilds)
+    cpu_before = time.process_time()
+    children_before = {pid: process_cpu(pid) for pid in pids}
+    packets_before = sum(guild.voice_client.packets for guild in guilds)
+    wall_before = time.perf_counter()
+
+    await asyncio.sleep(args.duration)
+
+    wall = time.perf_counter() - wall_before
+    packets = sum(guild.voice_client.packets for guild in guilds) - packets_before
+    own_cpu = time.process_time() - cpu_before
+    # a track change mid-window swaps ffmpeg processes, those get counted from zero
+    child_cpu = sum(process_cpu(pid) - children_before.get(pid, 0)
+                    for pid in ffmpeg_pids(guilds))
+    threads = threading.active_count()
+    rss = process_rss('self')
+    child_rss = sum(process_rss(pid) for pid in ffmpeg_pids(guilds))
+    stop.set()
+    await probe
+
+    playing = sum(1 for guild in guilds if guild.voice_client.is_playing())
+    for guild in guilds:
+        player = manager.peek_player(guild.id)
+        await player.call(player.stop, guild.voice_client)
+        manager.cleanup_player(guild.id)
+    manager.shutdown()
+
+    expected_packets = guild_count * wall / AudioPlayer.DELAY
+    return {
+        'guilds': guild_count,
+        'playing': playing,
+        'startup_s': startup,
+        'cpu_per_stream': (own_cpu + child_cpu) / wall / guild_count * 100,
+        'bot_cpu': own_cpu / wall * 100,
+        'ffmpeg_cpu': child_cpu / wall * 100,
+        'lag_p50_ms': percentile(lag_samples, 0.5) * 1000,
+        'lag_p99_ms': percentile(lag_samples, 0.99) * 1000,
+        'lag_max_ms': max(lag_samples, default=0) * 1000,
+        'threads': threads,
+        'rss_mb': rss / 2**20,
+        'ffmpeg_rss_mb': child_rss / 2**20,
+        'realtime': packets / expected_packets * 100 if expected_packets else 0,
+        'gap_p95': manager.metrics.stats()['gap_p95'],
+    }
+
+
+COLUMNS = [
+    ('guilds', '{:>6}'), ('playing', '{:>7}'), ('startup_s', '{:>9.2f}'),
+    ('cpu_per_stream', '{:>14.2f}'), ('bot_cpu', '{:>7.1f}'), ('ffmpeg_cpu', '{:>10.1f}'),
+    ('lag_p50_ms', '{:>10.2f}'), ('lag_p99_ms', '{:>10.2f}'), ('lag_max_ms', '{:>10.2f}'),
+    ('threads', '{:>7}'), ('rss_mb', '{:>7.1f}'), ('ffmpeg_rss_mb', '{:>13.1f}'),
+    ('realtime', '{:>8.1f}'), ('gap_p95', '{!s:>7}'),
+]
+
+
+def format_row(result):
+    return ' '.join(fmt.format(result[name]) for name, fmt in COLUMNS)
+
+
+async def run(args):
+    if shutil.which('ffmpeg') is None:
+        raise SystemExit('ffmpeg needs to be on the PATH to run the benchmark.')
+
+    with tempfile.TemporaryDirectory() as temp:
+        temp = Path(temp)
+        tone = make_tone(temp, args.track_seconds)
+        server, base_url = serve_directory(temp)
+
+        config = {
+            'media_volume': 10,
+            'max_media_duration': args.track_seconds + 60,
+            'inactivity_duration': 3600,
+            'music_channel_ids': [],
+            'opus_passthrough': args.path != 'pcm',
+            'audio_cache_enabled': False,
+            'voice_keep_warm': 0,
+        }
+        bot = FakeBot(config, temp)
+        bot.loop = asyncio.get_running_loop()
+        bot.track_info = {
+            'id': 'benchtone',
+            'title': 'Bench tone',
+            'webpage_url': f'{base_url}/{tone.name}',
+            'duration': args.track_seconds,
+            'acodec': 'opus',
+            'url': f'{base_url}/{tone.name}',
+        }
+        await migrate(bot.db)
+        # the copy path only skips the encode when the volume is left alone
+        volume = 1.0 if args.path == 'copy' else config['media_volume'] / 100
+
+        header = ' '.join(fmt.replace('.2f', '').replace('.1f', '').replace('!s', '').format(name)
+                          for name, fmt in COLUMNS)
+        lines = [f"path={args.path} duration={args.duration}s warmup={args.warmup}s "
+                 f"opus_encoder={'yes' if opus_available() else 'no'}", header]
+        print('\n'.join(lines), flush=True)
+        try:
+            for guild_count in args.guilds:
+                row = format_row(await run_level(bot, guild_count, args, volume))
+                lines.append(row)
+                print(row, flush=True)
+        finally:
+            server.shutdown()
+            bot.db.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--guilds', type=int, nargs='+', default=[1, 5, 10, 25, 50],
+                        help='guild counts to measure, one run each')
+    parser.add_argument('--path', choices=['pcm', 'opus', 'copy'], default='pcm',
+                        help='pcm: python volume and opus encode, opus: ffmpeg encodes, copy: opus passed through')
+    parser.add_argument('--duration', type=float, default=15, help='seconds to measure each run')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds to settle before measuring')
+    parser.add_argument('--track-seconds', type=int, default=300, help='length of the synthetic track')
+    parser.add_argument('--queue', type=int, default=2, help='songs queued behind the playing one')
+    parser.add_argument('--output', default='bench_output.txt', help='file to write the results to')
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
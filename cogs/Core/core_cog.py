@@ -1,9 +1,10 @@
 import discord
 import sqlite3
 import asyncio
+import time
 from discord.ext import commands, tasks
 from discord import Forbidden, HTTPException
-from utils.tools import update_with_discord, welcome_to_bot, generate_bar_chart, generate_pie_chart
+from utils.tools import update_with_discord, welcome_to_bot, generate_bar_chart, generate_pie_chart, timeframe_start
 from utils.logger import log_debug, log_error, log_info
 from datetime import datetime, timedelta
 
@@ -12,31 +13,14 @@ class CoreCog(commands.Cog, name="CoreCog", description="The core cog for the bo
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self._initialize_core_db()
+        # usage rows are written in batches, one commit per command would cap command throughput at disk speed
+        self.usage_writer = self.bot.db.batch_writer('''
+            INSERT INTO command_usage (guild_id, command_name, user_id, user_name, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''')
 
-    def _initialize_core_db(self):
-        """Initialize the SQLite database and create the required tables."""
-        with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-            cursor = conn.cursor()
-
-            # some foreign key support
-            cursor.execute('PRAGMA foreign_keys = ON;')
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS command_usage (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    guild_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    user_name TEXT NOT NULL,
-                    command_name TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            cursor.execute(
-                'CREATE INDEX IF NOT EXISTS idx_command_usage_guild_id ON command_usage (guild_id);')
-
-            conn.commit()
+    async def cog_unload(self):
+        await self.usage_writer.flush()
 
     @commands.Cog.listener()
     async def on_command_error(ctx, error):
@@ -178,15 +162,7 @@ class CoreCog(commands.Cog, name="CoreCog", description="The core cog for the bo
         user_name = ctx.author.display_name
         guild_id = ctx.guild.id if ctx.guild else "DM"
 
-        with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                INSERT INTO command_usage (guild_id, command_name, user_id, user_name)
-                VALUES (?, ?, ?, ?)
-            ''', (guild_id, command_name, user_id, user_name))
-
-            conn.commit()
+        await self.usage_writer.add((guild_id, command_name, user_id, user_name, int(time.time())))
 
     @commands.hybrid_command(
         name="commandstats",
@@ -214,55 +190,53 @@ class CoreCog(commands.Cog, name="CoreCog", description="The core cog for the bo
             return
 
         try:
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                params = [ctx.guild.id]
-                if group == 'command':
-                    select_clause = "SELECT command_name, COUNT(*) AS count"
-                    group_clause = "GROUP BY command_name"
-                elif group == 'hour':
-                    select_clause = "SELECT strftime('%H', timestamp) as hour, COUNT(*) AS count"
-                    group_clause = "GROUP BY hour"
-                elif group == 'day':
-                    select_clause = "SELECT strftime('%w', timestamp) as day_of_week, COUNT(*) AS count"
-                    group_clause = "GROUP BY day_of_week"
-
-                query = f"{select_clause} FROM command_usage WHERE guild_id = ?"
-
-                if timeframe == "today":
-                    query += " AND DATE(timestamp) = DATE('now')"
-                elif timeframe == "week":
-                    query += " AND timestamp >= DATE('now', '-7 days')"
-                elif timeframe == "month":
-                    query += " AND timestamp >= DATE('now', '-30 days')"
-
-                if user:
-                    query += " AND user_id = ?"
-                    params.append(str(user.id))
-
-                if command_name:
-                    query += " AND command_name = ?"
-                    params.append(command_name)
-
-                query += f" {group_clause} ORDER BY count DESC"
-
-                cursor.execute(query, params)
-                results = cursor.fetchall()
-
-                if results:
-                    if chart == "bar":
-                        title = f"Command Usage Stats by {group.title()} ({timeframe})"
-                        xlabel = group.title()
-                        ylabel = "Usage Count"
-                        await generate_bar_chart(ctx, results, title=title, xlabel=xlabel, ylabel=ylabel, group=group)
-                    elif chart == "pie":
-                        title = f"Command Usage Distribution by {group.title()} ({timeframe})"
-                        await generate_pie_chart(ctx, results, title=title, group=group)
-                    else:
-                        await self._send_text_stats(ctx, results, timeframe, user, command_name, group)
+            # include the usage still waiting in the buffer
+            await self.usage_writer.flush()
+
+            params = [ctx.guild.id]
+            if group == 'command':
+                select_clause = "SELECT command_name, SUM(count) AS count"
+                group_clause = "GROUP BY command_name"
+            elif group == 'hour':
+                select_clause = "SELECT printf('%02d', hour_ts / 3600 % 24) as hour, SUM(count) AS count"
+                group_clause = "GROUP BY hour"
+            elif group == 'day':
+                # 1970-01-01 was a Thursday
+                select_clause = "SELECT (hour_ts / 86400 + 4) % 7 as day_of_week, SUM(count) AS count"
+                group_clause = "GROUP BY day_of_week"
+
+            query = f"{select_clause} FROM command_usage_hourly WHERE guild_id = ?"
+
+            start = timeframe_start(timeframe)
+            if start is not None:
+                query += " AND hour_ts >= ?"
+                params.append(start)
+
+            if user:
+                query += " AND user_id = ?"
+                params.append(str(user.id))
+
+            if command_name:
+                query += " AND command_name = ?"
+                params.append(command_name)
+
+            query += f" {group_clause} ORDER BY count DESC"
+
+            results = await self.bot.db.fetchall(query, params)
+
+            if results:
+                if chart == "bar":
+                    title = f"Command Usage Stats by {group.title()} ({timeframe})"
+                    xlabel = group.title()
+                    ylabel = "Usage Count"
+                    await generate_bar_chart(ctx, results, title=title, xlabel=xlabel, ylabel=ylabel, group=group)
+                elif chart == "pie":
+                    title = f"Command Usage Distribution by {group.title()} ({timeframe})"
+                    await generate_pie_chart(ctx, results, title=title, group=group)
                 else:
-                    await ctx.send(f"No command usage data available for the selected filters.")
+                    await self._send_text_stats(ctx, results, timeframe, user, command_name, group)
+            else:
+                await ctx.send(f"No command usage data available for the selected filters.")
 
         except sqlite3.Error as e:
             await ctx.send(f"An error occurred with the database:\n{str(e)}")
@@ -0,0 +1,152 @@
+import re
+import time
+from collections import OrderedDict
+from cogs.Music.music_track import TrackInfo
+
+
+VIDEO_ID_REGEX = re.compile(
+    r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})')
+STREAM_EXPIRE_REGEX = re.compile(r'[?&/]expire[=/](\d+)')
+
+
+def normalize_query(query):
+    """Turns a URL or search term into a stable cache key."""
+    query = query.strip()
+    match = VIDEO_ID_REGEX.search(query)
+    if match:
+        return f"id:{match.group(1)}"
+    return f"search:{' '.join(query.lower().split())}"
+
+
+class MusicCache:
+    """LRU cache of resolved tracks, keyed by video id and by normalized query.
+
+    Track metadata is kept for `metadata_ttl` seconds, while the signed stream
+    URL is only trusted for `stream_ttl` seconds (or until it expires upstream,
+    whichever comes first).
+    """
+
+    def __init__(self, max_entries=512, metadata_ttl=86400, stream_ttl=3600):
+        self.max_entries = max_entries
+        self.metadata_ttl = metadata_ttl
+        self.stream_ttl = stream_ttl
+        self.entries = OrderedDict()
+        self.queries = {}
+        self.hits = 0
+        self.stream_misses = 0
+        self.misses = 0
+
+    def get(self, query_key, min_stream_ttl=0):
+        """
+        Looks up a track by normalized query.
+
+        Returns a copy of the TrackInfo, with `url` set only while the stream
+        URL stays fresh for at least `min_stream_ttl` more seconds, or None
+        when nothing usable is cached.
+        """
+        video_id = self.queries.get(query_key)
+        entry = self.entries.get(video_id) if video_id else None
+        now = time.time()
+
+        if entry is None or now - entry['stored_at'] > self.metadata_ttl:
+            if entry is not None:
+                self._evict(video_id)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(video_id)
+        if entry['stream_url'] and now + min_stream_ttl < entry['stream_expires']:
+            self.hits += 1
+            return entry['track'].copy(url=entry['stream_url'])
+        self.stream_misses += 1
+        return entry['track'].copy()
+
+    def put(self, query_key, info):
+        """Stores a resolved info dict, returning it trimmed down to a TrackInfo."""
+        track = TrackInfo.from_info(info)
+        video_id = track.id
+        stream_url = track.url
+
+        if video_id:
+            now = time.time()
+            entry = self.entries.pop(video_id, None) or {'queries': set()}
+            entry.update({
+                'track': track.copy(url=None),
+                'stored_at': now,
+                'stream_url': stream_url,
+                'stream_expires': self._stream_expiry(stream_url, now),
+            })
+            entry['queries'].update({query_key, f"id:{video_id}"})
+            for key in entry['queries']:
+                self.queries[key] = video_id
+            self.entries[video_id] = entry
+
+            while len(self.entries) > self.max_entries:
+                self._evict(next(iter(self.entries)))
+
+        return track
+
+    def export(self, query_keys=None):
+        """
+        Returns the cached entries in a JSON-friendly form, least recently used first.
+
+        With `query_keys`, only the entries those queries resolved to are included.
+        """
+        video_ids = None
+        if query_keys is not None:
+            video_ids = {self.queries.get(key) for key in query_keys}
+        return [{
+            'track': entry['track'].to_dict(),
+            'stored_at': entry['stored_at'],
+            'stream_url': entry['stream_url'],
+            'stream_expires': entry['stream_expires'],
+            'queries': sorted(entry['queries']),
+        } for video_id, entry in self.entries.items()
+            if video_ids is None or video_id in video_ids]
+
+    def load(self, exported):
+        """Restores entries saved by `export`, skipping ones whose metadata has expired."""
+        now = time.time()
+        for item in exported:
+            if now - item['stored_at'] > self.metadata_ttl:
+                continue
+            track = TrackInfo(**item['track'])
+            if not track.id or track.id in self.entries:
+                continue
+            entry = {
+                'track': track,
+                'stored_at': item['stored_at'],
+                'stream_url': item['stream_url'],
+                'stream_expires': item['stream_expires'],
+                'queries': set(item['queries']),
+            }
+            for key in entry['queries']:
+                self.queries[key] = track.id
+            self.entries[track.id] = entry
+        while len(self.entries) > self.max_entries:
+            self._evict(next(iter(self.entries)))
+
+    def stats(self):
+        """Returns the cache size and hit/miss counters."""
+        return {
+            'entries': len(self.entries),
+            'queries': len(self.queries),
+            'hits': self.hits,
+            'stream_misses': self.stream_misses,
+            'misses': self.misses,
+        }
+
+    def _stream_expiry(self, stream_url, now):
+        expires = now + self.stream_ttl
+        match = STREAM_EXPIRE_REGEX.search(stream_url or '')
+        if match:
+            # leave a minute of headroom for ffmpeg to open the stream
+            expires = min(expires, int(match.group(1)) - 60)
+        return expires
+
+    def _evict(self, video_id):
+        entry = self.entries.pop(video_id, None)
+        if entry:
+            for key in entry['queries']:
+                if self.queries.get(key) == video_id:
+                    del self.queries[key]
@@ -1,10 +1,13 @@
 import discord
 import asyncio
+import time
 import sqlite3
 from discord.ext import commands
 from cogs.Music.music_manager import MusicManager
+from cogs.Music.music_queue import QueueEntry, QueueFullError
+from cogs.Music.music_controls import CONTROL_EMOJIS
 from utils.logger import log_debug, log_error
-from utils.tools import update_config, create_embed, join_voice_channel, format_time, generate_bar_chart, generate_pie_chart
+from utils.tools import update_config, create_embed, join_voice_channel, format_time, generate_bar_chart, generate_pie_chart, timeframe_start
 from datetime import datetime
 from random import shuffle
 
@@ -18,42 +21,18 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
         self.media_volume = self.bot.config['media_volume'] / 100
         self.request_icon = ':satellite: '
         self.music_manager = MusicManager(self.bot)
-        self._initialize_music_db()
         log_debug(bot, "MusicCog initialized.")
 
-    def _initialize_music_db(self):
-        """Initialize the SQLite database and create the required tables."""
-        with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-            cursor = conn.cursor()
-
-            # idk some foreign key support
-            cursor.execute('PRAGMA foreign_keys = ON;')
-
-            # music tracking table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS music_actions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    guild_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    user_name TEXT NOT NULL,
-                    media_title TEXT NOT NULL,
-                    media_url TEXT NOT NULL,
-                    genre TEXT DEFAULT Unknown,
-                    playback_speed REAL,
-                    duration REAL,
-                    action TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            cursor.execute(
-                'CREATE INDEX IF NOT EXISTS idx_music_actions_guild_action ON music_actions (guild_id, action);')
-            cursor.execute(
-                'CREATE INDEX IF NOT EXISTS idx_music_actions_guild_action_timestamp ON music_actions (guild_id, action, timestamp);')
-            cursor.execute(
-                'CREATE INDEX IF NOT EXISTS idx_music_actions_guild_user ON music_actions (guild_id, user_id);')
-
-            conn.commit()
+    async def cog_load(self):
+        """Registers the player buttons and checks the audio cache files once the cog is loaded."""
+        # persistent, so buttons on player messages from before a restart keep working
+        self.bot.add_view(self.music_manager.controls)
+        self.music_manager.start()
+        asyncio.create_task(self.music_manager.resolver.disk_cache.verify())
+
+    async def cog_unload(self):
+        """Shuts down the player sweep and shared services when the cog is unloaded."""
+        self.music_manager.shutdown()
 
     @commands.hybrid_command(name="play", help="Plays a song provided by the user. Can be search term or URL.")
     async def play_song(self, ctx, song: str):
@@ -63,22 +42,19 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
         if voice_client is None:
             return
 
-        if len(music_player.queue) >= 100:
-            await ctx.send("The queue is full! Maximum queue size is 100 songs.", delete_after=12)
+        if music_player.queue.is_full():
+            await ctx.send(f"The queue is full! Maximum queue size is {music_player.queue.capacity} songs.", delete_after=12)
             return None
 
         await ctx.send(f"{self.request_icon} **Song Requested**\nAdded to the queue:\n{song}")
 
-        if music_player.is_playing:
-            await music_player.add_to_queue(ctx, song, 1.0)
-        else:
-            music_player.is_playing = True
-            try:
-                await music_player.play_youtube_audio(ctx.channel, voice_client, song, volume=self.media_volume, requester=ctx.author)
-            except Exception as e:
-                await ctx.send(f"Error playing {song}:\n\nReport this to your server admin if you think this is a bug.")
-                log_error(self.bot, f"Error playing {song}: `{str(e)}`")
-                music_player.is_playing = False
+        try:
+            await music_player.call(music_player.request, ctx.channel, voice_client, QueueEntry(song, 1.0, ctx.author, ctx.channel), self.media_volume)
+        except QueueFullError as e:
+            await ctx.send(f"The queue is full! {e}.", delete_after=12)
+        except Exception as e:
+            await ctx.send(f"Error playing {song}:\n\nReport this to your server admin if you think this is a bug.")
+            log_error(self.bot, f"Error playing {song}: `{str(e)}`")
 
     # for jonston
     @commands.hybrid_command(name="replay", help="Plays the most recent song played in general.")
@@ -86,42 +62,39 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
         """Plays the most recent song played in the current guild."""
         music_player = await self.music_manager.get_player(ctx.guild)
         try:
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                cursor.execute('''
-                    SELECT media_title, media_url, playback_speed, user_name
-                    FROM music_actions 
-                    WHERE action = 'request' AND guild_id = ?
-                    ORDER BY timestamp DESC 
-                    LIMIT 1
-                ''', (ctx.guild.id,))
-
-                recent_song = cursor.fetchone()
+            recent_song = await self.bot.db.fetchone('''
+                SELECT media_title, media_url, playback_speed, user_name
+                FROM music_actions 
+                WHERE action = 'request' AND guild_id = ?
+                ORDER BY created_at DESC 
+                LIMIT 1
+            ''', (ctx.guild.id,))
+
+            if recent_song is None:
+                await ctx.send("No songs have been requested yet!", delete_after=12)
+                return
 
-                if recent_song is None:
-                    await ctx.send("No songs have been requested yet!", delete_after=12)
-                    return
+            media_title, media_url, playback_speed, user_name = recent_song
+            playback_speed = playback_speed or 1.0
 
-                media_title, media_url, playback_speed, user_name = recent_song
-                playback_speed = playback_speed or 1.0
+            voice_client = await join_voice_channel(self.bot, ctx, self.music_channel_ids)
+            if voice_client is None:
+                return
 
-                voice_client = await join_voice_channel(self.bot, ctx, self.music_channel_ids)
-                if voice_client is None:
-                    return
+            if music_player.queue.is_full():
+                await ctx.send(f"The queue is full! Maximum queue size is {music_player.queue.capacity} songs.", delete_after=12)
+                return
 
-                await ctx.send(f"{self.request_icon} **Song Requested**\nAdded the most recent song to the queue:\n{media_title} requested by {user_name} (at speed {playback_speed}x)")
+            await ctx.send(f"{self.request_icon} **Song Requested**\nAdded the most recent song to the queue:\n{media_title} requested by {user_name} (at speed {playback_speed}x)")
 
-                if music_player.is_playing:
-                    await music_player.add_to_queue(ctx, media_url, playback_speed)
-                else:
-                    music_player.is_playing = True
-                    await music_player.play_youtube_audio(ctx.channel, voice_client, media_url, volume=self.media_volume, playback_speed=playback_speed, requester=ctx.author)
+            await music_player.call(music_player.request, ctx.channel, voice_client, QueueEntry(
+                media_url, playback_speed, ctx.author, ctx.channel, title=media_title), self.media_volume)
+        except QueueFullError as e:
+            await ctx.send(f"The queue is full! {e}.", delete_after=12)
         except sqlite3.Error as e:
             await ctx.send(f"Error playing the most recent song:\n\nReport this to your server admin if you think this is a bug.")
             log_error(
                 self.bot, f"Error playing the most recent song: {str(e)}")
-            music_player.is_playing = False
 
     @commands.hybrid_command(name="slowplay", help="Plays a song at 0.75x speed.")
     async def slowplay(self, ctx, song: str):
@@ -141,27 +114,87 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
             if voice_client is None:
                 return
 
-            if len(music_player.queue) >= 100:
-                await ctx.send("The queue is full! Maximum queue size is 100 songs.", delete_after=12)
+            if music_player.queue.is_full():
+                await ctx.send(f"The queue is full! Maximum queue size is {music_player.queue.capacity} songs.", delete_after=12)
                 return
 
             await ctx.send(f"{self.request_icon} **Song Requested**\nAdded song at {label} speed to the queue:\n{song}")
 
-            if music_player.is_playing:
-                await music_player.add_to_queue(ctx, song, speed)
-            else:
-                music_player.is_playing = True
-                await music_player.play_youtube_audio(ctx.channel, voice_client, song, playback_speed=speed, volume=self.media_volume, requester=ctx.author)
+            await music_player.call(music_player.request, ctx.channel, voice_client, QueueEntry(song, speed, ctx.author, ctx.channel), self.media_volume)
+        except QueueFullError as e:
+            await ctx.send(f"The queue is full! {e}.", delete_after=12)
         except Exception as e:
             await ctx.send(f"Error playing {song} at {label} speed:\n\nReport this to your server admin if you think this is a bug.")
             log_error(
                 self.bot, f"Error playing {song} at {label} speed: {str(e)}")
-            music_player.is_playing = False
+
+    @commands.hybrid_command(name="playlist", help="Queues the songs of a YouTube playlist.")
+    async def play_playlist(self, ctx, url: str):
+        """Plays the first song of a playlist and queues the rest in the background."""
+        if 'list=' not in url:
+            await ctx.send("That doesn't look like a playlist link.", delete_after=12)
+            return
+
+        music_player = await self.music_manager.get_player(ctx.guild)
+        voice_client = await join_voice_channel(self.bot, ctx, self.music_channel_ids)
+        if voice_client is None:
+            return
+
+        if music_player.queue.is_full():
+            await ctx.send(f"The queue is full! Maximum queue size is {music_player.queue.capacity} songs.", delete_after=12)
+            return
+        if music_player.import_task and not music_player.import_task.done():
+            await ctx.send("Still adding songs from another playlist, try again when it's done.", delete_after=12)
+            return
+
+        status = await ctx.send(f"{self.request_icon} **Playlist Requested**\nAdding songs from:\n{url}")
+        music_player.import_task = asyncio.create_task(
+            self._import_playlist(ctx, voice_client, music_player, url, status))
+
+    async def _import_playlist(self, ctx, voice_client, music_player, url, status):
+        """Streams a playlist's entries into the player, reporting progress on the status message."""
+        added = skipped = 0
+        queue_full = cancelled = False
+        try:
+            # one more than the queue holds, since the first song may start playing right away
+            async for entry in self.music_manager.resolver.iter_playlist(url, music_player.queue.capacity + 1):
+                media_url = entry.get('webpage_url') or entry.get('url')
+                if not media_url or (entry.get('duration') or 0) > music_player.max_media_duration:
+                    skipped += 1
+                    continue
+                try:
+                    await music_player.call(music_player.request, ctx.channel, voice_client, QueueEntry(
+                        media_url, 1.0, ctx.author, ctx.channel, title=entry.get('title')), self.media_volume)
+                except QueueFullError:
+                    queue_full = True
+                    break
+                added += 1
+                if added % 10 == 0:
+                    await status.edit(content=f"{self.request_icon} **Playlist Requested**\nAdded {added} songs so far from:\n{url}")
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            log_error(self.bot, f"Error importing playlist {url}: {str(e)}")
+            await ctx.send(f"Error reading that playlist, only {added} songs were added.", delete_after=12)
+        finally:
+            # a stopped import still gets its summary, or the status would say it is adding songs forever
+            summary = f"Added {added} songs from:\n{url}"
+            if skipped:
+                summary += f"\nSkipped {skipped} songs that were too long or unavailable."
+            if queue_full:
+                summary += f"\nStopped early because the queue is full ({music_player.queue.capacity} songs)."
+            if cancelled:
+                summary += "\nStopped before the rest of the playlist was added."
+            try:
+                await status.edit(content=f"{self.request_icon} **Playlist Requested**\n{summary}")
+            except discord.HTTPException as e:
+                log_error(self.bot, f"Failed to update playlist status: {str(e)}")
 
     @commands.hybrid_command(name="stop", help="Stops the audio and clears the queue.")
     async def stop(self, ctx):
         """Stops the audio, clears the queue, and disconnects."""
-        music_player = await self.music_manager.get_player(ctx.guild)
+        music_player = self.music_manager.peek_player(ctx.guild.id)
         try:
             if ctx.author.voice is None:
                 await ctx.send("You need to be in a voice channel to use this command!", delete_after=12)
@@ -170,25 +203,27 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
                 await ctx.send("You need type in the music chat to use this command!", delete_after=12)
                 return None
 
-            voice_client = discord.utils.get(
-                self.bot.voice_clients, guild=ctx.guild)
-            if voice_client and voice_client.is_playing():
+            voice_client = ctx.guild.voice_client
+            # canceling the lookup can't wait its turn, since the lookup is what holds up the player
+            if music_player is None:
+                await ctx.send("No audio is playing.", delete_after=12)
+            elif voice_client and voice_client.is_playing():
                 await ctx.send("Stopping audio and clearing the queue.", delete_after=12)
-                voice_client.stop()
-                music_player.queue.clear()
-                await music_player.stop_playing()
+                await music_player.call(music_player.stop, voice_client)
+            elif music_player.cancel_resolve():
+                await ctx.send("Canceling the song lookup and clearing the queue.", delete_after=12)
+                await music_player.call(music_player.stop, voice_client)
 
             else:
                 await ctx.send("No audio is playing.", delete_after=12)
         except Exception as e:
             await ctx.send(f"Error stopping audio:\n\nReport this to your server admin if you think this is a bug.")
             log_error(self.bot, f"Error stopping audio: {str(e)}")
-            music_player.is_playing = False
 
     @commands.hybrid_command(name="skip", help="Skips the current song.")
     async def skip(self, ctx):
         """Skips the current song."""
-        music_player = await self.music_manager.get_player(ctx.guild)
+        music_player = self.music_manager.peek_player(ctx.guild.id)
         if ctx.author.voice is None:
             await ctx.send("You need to be in a voice channel to use this command!", delete_after=12)
             return
@@ -196,54 +231,50 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
             await ctx.send("You need to type in the music chat to use this command!", delete_after=12)
             return
 
-        voice_client = discord.utils.get(
-            self.bot.voice_clients, guild=ctx.guild)
-        if voice_client and voice_client.is_playing():
+        voice_client = ctx.guild.voice_client
+        if music_player is None:
+            await ctx.send("No audio is playing.", delete_after=12)
+        elif voice_client and voice_client.is_playing():
             try:
-                with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                    conn.execute('PRAGMA foreign_keys = ON;')
-                    cursor = conn.cursor()
-                    media_url = music_player.current_media_url
-                    genre = "Unknown"
-                    if music_player.current_video_info.get('genre'):
-                        genre = genre[0]
-
-                    cursor.execute('''
-                        INSERT INTO music_actions (
-                            guild_id,
-                            user_id,
-                            user_name,
-                            media_title,
-                            media_url,
-                            genre,
-                            playback_speed,
-                            duration,
-                            action
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'skip')
-                    ''', (
-                        ctx.guild.id,
-                        ctx.author.id,
-                        ctx.author.display_name,
-                        music_player.current_video_info['title'],
+                media_url = music_player.current_media_url
+                await self.bot.db.execute('''
+                    INSERT INTO music_actions (
+                        guild_id,
+                        user_id,
+                        user_name,
+                        media_title,
                         media_url,
                         genre,
-                        music_player.current_playback_speed,
-                        music_player.current_video_info['duration']
-                    ))
-
-                    conn.commit()
+                        playback_speed,
+                        duration,
+                        action,
+                        created_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'skip', ?)
+                ''', (
+                    ctx.guild.id,
+                    ctx.author.id,
+                    ctx.author.display_name,
+                    music_player.current_video_info.title,
+                    media_url,
+                    music_player.current_video_info.genre,
+                    music_player.current_playback_speed,
+                    music_player.current_video_info.duration,
+                    int(time.time())
+                ))
 
             except sqlite3.Error as e:
-                conn.rollback()
                 await ctx.send(f"Error while recording skip.")
                 log_error(self.bot, f"Error recording skip: {str(e)}")
             except Exception as e:
                 await ctx.send(f"Error skipping song.\n\nReport this to your server admin if you think this is a bug.")
                 log_error(self.bot, f"Error skipping song: {str(e)}")
 
-            voice_client.stop()
-            await music_player.stop_playing()
+            await music_player.call(music_player.skip, voice_client)
+            await ctx.send("Skipping song.", delete_after=12)
+
+        elif music_player.cancel_resolve():
             await ctx.send("Skipping song.", delete_after=12)
+            await music_player.call(music_player.skip, voice_client)
 
         else:
             await ctx.send("No audio is playing.", delete_after=12)
@@ -251,15 +282,21 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
     @commands.hybrid_command(name="queue", help="Displays the current queue.")
     async def list_queue(self, ctx):
         """Lists the current queue."""
-        music_player = await self.music_manager.get_player(ctx.guild)
+        music_player = self.music_manager.peek_player(ctx.guild.id)
 
-        if music_player.queue.is_empty():
+        if music_player is None or music_player.queue.is_empty():
             await ctx.send("The queue is empty.", delete_after=12)
             return
 
         queue_list = ""
-        for index, song in enumerate(music_player.queue._queue):
-            queue_list += f"{index + 1}. [{song.title}]({song.url}) requested by {song.requester.display_name}\n"
+        for index, song in enumerate(music_player.queue.peek(20)):
+            requester = song.requester.display_name if song.requester else "someone"
+            if song.url.startswith('http'):
+                queue_list += f"{index + 1}. [{song.title}]({song.url}) requested by {requester}\n"
+            else:
+                queue_list += f"{index + 1}. {song.title} requested by {requester}\n"
+        if len(music_player.queue) > 20:
+            queue_list += f"...and {len(music_player.queue) - 20} more\n"
 
         embed = create_embed(
             "Current Queue", f"Current queue:\n{queue_list}", discord.Color.blue(), self.thumbnail)
@@ -268,7 +305,7 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
     @commands.hybrid_command(name="clear", help="Clears the current queue.")
     async def clear_queue(self, ctx):
         """Clears the queue."""
-        music_player = await self.music_manager.get_player(ctx.guild)
+        music_player = self.music_manager.peek_player(ctx.guild.id)
         try:
             if ctx.author.voice is None:
                 await ctx.send("You need to be in a voice channel to use this command!", delete_after=12)
@@ -277,7 +314,8 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
                 await ctx.send("You need type in the music chat to use this command!", delete_after=12)
                 return None
 
-            music_player.queue.clear()
+            if music_player:
+                await music_player.call(music_player.clear)
             await ctx.send("Queue cleared.", delete_after=12)
         except Exception as e:
             await ctx.send(f"Error clearing the queue:\n\nReport this to your server admin if you think this is a bug.")
@@ -298,21 +336,29 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
                 embed = create_embed(
                     "Current Volume", f"The current volume is: {self.media_volume}\nUse /volume <0-100> to set the volume.", discord.Color.blue(), self.thumbnail)
                 await ctx.send(embed=embed)
+                return
             elif volume < 0 or volume > 100:
                 embed = create_embed(
                     "Invalid Volume", "Volume must be between 0 and 100.", discord.Color.red(), self.thumbnail)
                 await ctx.send(embed=embed)
                 return
 
-            voice_client = discord.utils.get(
-                self.bot.voice_clients, guild=ctx.guild)
+            voice_client = ctx.guild.voice_client
 
             if voice_client and voice_client.is_playing():
-                voice_client.source.volume = volume
-                self.media_volume = volume
-                update_config(self.bot.config_file, {"music_volume": volume})
+                music_player = self.music_manager.peek_player(ctx.guild.id)
+                self.media_volume = volume / 100
+                if music_player:
+                    await music_player.call(music_player.set_volume, self.media_volume)
+                update_config(self.bot.config_file, {"media_volume": volume})
+                if isinstance(voice_client.source, discord.PCMVolumeTransformer):
+                    voice_client.source.volume = self.media_volume
+                    description = f"Volume set to {volume}"
+                else:
+                    # opus streams get their volume from ffmpeg, so it applies from the next song
+                    description = f"Volume set to {volume}, starting with the next song"
                 embed = create_embed(
-                    "Volume Set", f"Volume set to {volume}", discord.Color.green(), self.thumbnail)
+                    "Volume Set", description, discord.Color.green(), self.thumbnail)
                 await ctx.send(embed=embed)
             else:
                 await ctx.send("No audio is playing.", delete_after=12)
@@ -320,185 +366,147 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
             await ctx.send(f"Error setting the volume:\n\nReport this to your server admin if you think this is a bug.")
             log_error(self.bot, f"Error setting the volume: {str(e)}")
 
-    @commands.Cog.listener()
-    async def on_reaction_add(self, reaction, user):
-
-        if user.bot:
+    async def handle_control(self, action, guild, user, channel):
+        """Runs a player control from either a button or a reaction."""
+        music_player = self.music_manager.peek_player(guild.id)
+        if music_player is None:
+            # the player was evicted, so there is nothing left to control
+            await channel.send("No audio is playing.", delete_after=12)
             return
+        voice_client = guild.voice_client
 
-        message = reaction.message
-        guild = message.guild
+        if action == 'resume':
+            if voice_client:
+                music_player.resume(voice_client)
 
-        music_player = await self.music_manager.get_player(guild)
+        elif action == 'pause':
+            if voice_client:
+                music_player.pause(voice_client)
 
-        if reaction.emoji == '▶️':
-            voice_client = discord.utils.get(
-                self.bot.voice_clients, guild=message.guild)
-            if voice_client and not voice_client.is_playing():
-                voice_client.resume()
-
-        elif reaction.emoji == '⏸️':
-            voice_client = discord.utils.get(
-                self.bot.voice_clients, guild=message.guild)
-            if voice_client and voice_client.is_playing():
-                voice_client.pause()
-
-        elif reaction.emoji == '⏹️':
-            voice_client = discord.utils.get(
-                self.bot.voice_clients, guild=message.guild)
-            if voice_client and voice_client.is_playing():
+        elif action == 'stop':
+            if voice_client and voice_client.is_playing() or music_player.cancel_resolve():
                 try:
-                    await message.channel.send("Audio stopped and queue cleared.", delete_after=12)
-                    voice_client.stop()
-                    music_player.queue.clear()
-                    await music_player.stop_playing()
+                    await channel.send("Audio stopped and queue cleared.", delete_after=12)
+                    await music_player.call(music_player.stop, voice_client)
                 except Exception as e:
-                    await message.channel.send(f"Error stopping audio.\n\nReport this to your server admin if you think this is a bug.")
+                    await channel.send(f"Error stopping audio.\n\nReport this to your server admin if you think this is a bug.")
                     log_error(self.bot, f"Error stopping audio: {str(e)}")
 
         # for jonston
-        elif reaction.emoji == '⏮️':
-            voice_client = discord.utils.get(
-                self.bot.voice_clients, guild=message.guild)
+        elif action == 'previous':
             if user.voice is None:
-                await message.channel.send("You need to be in a voice channel to use this command!", delete_after=12)
+                await channel.send("You need to be in a voice channel to use this command!", delete_after=12)
                 return
             try:
                 if music_player.current_media_url:
-                    await music_player.add_to_queue(guild, music_player.current_media_url, music_player.current_playback_speed)
-                    await message.channel.send("Previous song will be played again.", delete_after=12)
+                    title = music_player.current_video_info.title if music_player.current_video_info else None
+                    await music_player.call(music_player.enqueue, QueueEntry(
+                        music_player.current_media_url, music_player.current_playback_speed, user, channel, title=title))
+                    await channel.send("Previous song will be played again.", delete_after=12)
                 else:
-                    await message.channel.send("No previous song to play.", delete_after=12)
+                    await channel.send("No previous song to play.", delete_after=12)
+            except QueueFullError as e:
+                await channel.send(f"The queue is full! {e}.", delete_after=12)
             except Exception as e:
-                await message.channel.send(f"Error playing previous song.\n\nReport this to your server admin if you think this is a bug.")
+                await channel.send(f"Error playing previous song.\n\nReport this to your server admin if you think this is a bug.")
                 log_error(self.bot, f"Error playing previous song: {str(e)}")
 
-        elif reaction.emoji == '⏭️':
-            voice_client = discord.utils.get(
-                self.bot.voice_clients, guild=message.guild)
-
+        elif action == 'skip':
             if user.voice is None:
-                await message.channel.send("You need to be in a voice channel to use this command!", delete_after=12)
+                await channel.send("You need to be in a voice channel to use this command!", delete_after=12)
+                return
+            if not voice_client or not music_player.current_video_info:
+                await channel.send("No audio is playing.", delete_after=12)
                 return
             try:
-                with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                    conn.execute('PRAGMA foreign_keys = ON;')
-                    cursor = conn.cursor()
-                    media_url = music_player.current_media_url
-                    genre = "Unknown"
-                    if music_player.current_video_info.get('genre'):
-                        genre = genre[0]
-
-                    cursor.execute('''
-                        INSERT INTO music_actions (
-                            guild_id,
-                            user_id,
-                            user_name,
-                            media_title,
-                            media_url,
-                            genre,
-                            playback_speed,
-                            duration,
-                            action
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'skip')
-                    ''', (
-                        message.guild.id,
-                        user.id,
-                        user.display_name,
-                        music_player.current_video_info['title'],
+                media_url = music_player.current_media_url
+                await self.bot.db.execute('''
+                    INSERT INTO music_actions (
+                        guild_id,
+                        user_id,
+                        user_name,
+                        media_title,
                         media_url,
                         genre,
-                        music_player.current_playback_speed,
-                        music_player.current_video_info['duration']
-                    ))
-
-                    conn.commit()
+                        playback_speed,
+                        duration,
+                        action,
+                        created_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'skip', ?)
+                ''', (
+                    guild.id,
+                    user.id,
+                    user.display_name,
+                    music_player.current_video_info.title,
+                    media_url,
+                    music_player.current_video_info.genre,
+                    music_player.current_playback_speed,
+                    music_player.current_video_info.duration,
+                    int(time.time())
+                ))
 
             except sqlite3.Error as e:
-                conn.rollback()
-                await message.channel.send(f"Error while recording skip.")
+                await channel.send(f"Error while recording skip.")
                 log_error(self.bot, f"Error recording skip: {str(e)}")
             except Exception as e:
-                await message.channel.send(f"Error skipping song.\n\nReport this to your server admin if you think this is a bug.")
+                await channel.send(f"Error skipping song.\n\nReport this to your server admin if you think this is a bug.")
                 log_error(self.bot, f"Error skipping song: {str(e)}")
 
-            voice_client.stop()
-            await message.channel.send("Skipping song.", delete_after=12)
+            await music_player.call(music_player.skip, voice_client)
+            await channel.send("Skipping song.", delete_after=12)
 
-        elif reaction.emoji == '❤️':
+        elif action == 'like':
+            if not music_player.current_video_info:
+                return
             try:
-                with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                    conn.execute('PRAGMA foreign_keys = ON;')
-                    cursor = conn.cursor()
-                    media_url = music_player.current_media_url
-                    genre = "Unknown"
-                    if music_player.current_video_info.get('genre'):
-                        genre = genre[0]
-
-                    cursor.execute('''
-                        INSERT INTO music_actions (
-                            guild_id,
-                            user_id,
-                            user_name,
-                            media_title,
-                            media_url,
-                            genre,
-                            playback_speed,
-                            duration,
-                            action
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'like')
-                    ''', (
-                        message.guild.id,
-                        user.id,
-                        user.display_name,
-                        music_player.current_video_info['title'],
+                media_url = music_player.current_media_url
+                await self.bot.db.execute('''
+                    INSERT INTO music_actions (
+                        guild_id,
+                        user_id,
+                        user_name,
+                        media_title,
                         media_url,
                         genre,
-                        music_player.current_playback_speed,
-                        music_player.current_video_info['duration']
-                    ))
-
-                    conn.commit()
-                    await message.channel.send(f"❤️ **{user.name}** liked the song.", delete_after=12)
+                        playback_speed,
+                        duration,
+                        action,
+                        created_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'like', ?)
+                ''', (
+                    guild.id,
+                    user.id,
+                    user.display_name,
+                    music_player.current_video_info.title,
+                    media_url,
+                    music_player.current_video_info.genre,
+                    music_player.current_playback_speed,
+                    music_player.current_video_info.duration,
+                    int(time.time())
+                ))
+
+                await channel.send(f"❤️ **{user.name}** liked the song.", delete_after=12)
             except sqlite3.Error as e:
-                conn.rollback()
-                await message.channel.send(f"Error while recording like:\n `{str(e)}`")
+                await channel.send(f"Error while recording like:\n `{str(e)}`")
                 log_error(self.bot, f"Error recording like: {str(e)}")
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
-        # fallback for cached messages
-        if payload.user_id == self.bot.user.id:
+        # raw events fire for every message, cached or not, so this is the only reaction listener
+        guild_id = self.music_manager.player_messages.get(payload.message_id)
+        if guild_id is None or guild_id != payload.guild_id:
             return
 
-        guild = self.bot.get_guild(payload.guild_id)
-        if not guild:
+        action = CONTROL_EMOJIS.get(str(payload.emoji))
+        if action is None or payload.member is None or payload.member.bot:
             return
 
-        music_player = await self.music_manager.get_player(guild)
-
-        channel = guild.get_channel(payload.channel_id)
+        guild = self.bot.get_guild(payload.guild_id)
+        channel = guild.get_channel(payload.channel_id) if guild else None
         if not channel:
             return
 
-        try:
-            message = await channel.fetch_message(payload.message_id)
-        except discord.NotFound:
-            return
-        except discord.Forbidden:
-            return
-        except discord.HTTPException:
-            return
-
-        user = guild.get_member(payload.user_id)
-        if not user:
-            return
-
-        reaction = discord.Reaction(
-            message=message, emoji=payload.emoji, data=payload)
-
-        # resend the reaction event to the on_reaction_add listener
-        await self.on_reaction_add(reaction, user)
+        await self.handle_control(action, guild, payload.member, channel)
 
     async def _play_recent_song(self, ctx, user: discord.User = None):
         """Handles playing the most recent song requested by the user or another user."""
@@ -509,42 +517,39 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
 
             user_id = str(user.id)
 
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                cursor.execute('''
-                    SELECT media_title, media_url, playback_speed
-                    FROM music_actions 
-                    WHERE user_id = ? AND action = 'request' AND guild_id = ?
-                    ORDER BY timestamp DESC 
-                    LIMIT 1
-                ''', (user_id, ctx.guild.id))
+            recent_song = await self.bot.db.fetchone('''
+                SELECT media_title, media_url, playback_speed
+                FROM music_actions 
+                WHERE user_id = ? AND action = 'request' AND guild_id = ?
+                ORDER BY created_at DESC 
+                LIMIT 1
+            ''', (user_id, ctx.guild.id))
 
-                recent_song = cursor.fetchone()
+            if recent_song is None:
+                await ctx.send(f"{user.mention} hasn't requested any songs yet!", delete_after=12)
+                return
 
-                if recent_song is None:
-                    await ctx.send(f"{user.mention} hasn't requested any songs yet!", delete_after=12)
-                    return
+            media_title, media_url, playback_speed = recent_song
+            playback_speed = playback_speed or 1.0
 
-                media_title, media_url, playback_speed = recent_song
-                playback_speed = playback_speed or 1.0
+            voice_client = await join_voice_channel(self.bot, ctx, self.music_channel_ids)
+            if voice_client is None:
+                return
 
-                voice_client = await join_voice_channel(self.bot, ctx, self.music_channel_ids)
-                if voice_client is None:
-                    return
+            if music_player.queue.is_full():
+                await ctx.send(f"The queue is full! Maximum queue size is {music_player.queue.capacity} songs.", delete_after=12)
+                return
 
-                await ctx.send(f"{self.request_icon} **Song Requested**\nAdded {user.mention}'s most recent song to the queue:\n{media_title} (at speed {playback_speed}x)")
+            await ctx.send(f"{self.request_icon} **Song Requested**\nAdded {user.mention}'s most recent song to the queue:\n{media_title} (at speed {playback_speed}x)")
 
-                if music_player.is_playing:
-                    music_player.queue.append((media_url, playback_speed))
-                else:
-                    music_player.is_playing = True
-                    await music_player.play_youtube_audio(ctx.channel, voice_client, media_url, self.media_volume, playback_speed, user)
+            await music_player.call(music_player.request, ctx.channel, voice_client, QueueEntry(
+                media_url, playback_speed, user, ctx.channel, title=media_title), self.media_volume)
+        except QueueFullError as e:
+            await ctx.send(f"The queue is full! {e}.", delete_after=12)
         except sqlite3.Error as e:
             await ctx.send(f"Error playing the most recent song.")
             log_error(
                 self.bot, f"Error playing the most recent song: {str(e)}")
-            music_player.is_playing = False
 
     @commands.hybrid_command(name="musicstats", help="request/like/skip/duration | all/today/week/month | song/hour/day | bar/pie")
     async def music_stats(self, ctx, stat_type: str = "request", timeframe: str = "all", user: discord.Member = None, chart: str = None, group: str = "song"):
@@ -570,92 +575,83 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
             return
 
         try:
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                if stat_type == "duration":
-                    await self._calculate_total_listening_time(ctx, cursor, timeframe, user)
-                    return
-
-                params = [stat_type, ctx.guild.id]
-
-                if group == 'song':
-                    select_clause = "SELECT media_title, media_url, COUNT(*) as count"
-                    group_clause = "GROUP BY media_title, media_url"
-                elif group == 'hour':
-                    select_clause = "SELECT strftime('%H', timestamp) as hour, COUNT(*) as count"
-                    group_clause = "GROUP BY hour"
-                elif group == 'day':
-                    select_clause = "SELECT strftime('%w', timestamp) as day_of_week, COUNT(*) as count"
-                    group_clause = "GROUP BY day_of_week"
-
-                query = f"{select_clause} FROM music_actions WHERE action = ? AND guild_id = ?"
-
-                if timeframe == "today":
-                    query += " AND DATE(timestamp) = DATE('now')"
-                elif timeframe == "week":
-                    query += " AND timestamp >= DATE('now', '-7 days')"
-                elif timeframe == "month":
-                    query += " AND timestamp >= DATE('now', '-30 days')"
-
-                if user:
-                    query += " AND user_id = ?"
-                    params.append(str(user.id))
-
-                query += f" {group_clause} ORDER BY count DESC LIMIT 5"
-
-                cursor.execute(query, params)
-                data = cursor.fetchall()
-
-                if data:
-                    if chart == "bar":
-                        title = f"Top {stat_type}s by {group} ({timeframe})"
-                        xlabel = group.title()
-                        ylabel = f"Number of {stat_type}s"
-                        await generate_bar_chart(ctx, data, title=title, xlabel=xlabel, ylabel=ylabel, group=group)
-                    elif chart == "pie":
-                        title = f"Top {stat_type}s by {group} ({timeframe})"
-                        await generate_pie_chart(ctx, data, title=title, group=group)
-                    else:
-                        message = f"**Top {stat_type}s by {group} ({timeframe}):**\n"
-                        for i, row in enumerate(data, start=1):
-                            if group == 'song':
-                                media_title, media_url, count = row
-                                message += f"{i}. [{media_title}](<{media_url}>): {count} {stat_type}s\n"
-                            elif group == 'hour':
-                                hour, count = row
-                                message += f"{i}. Hour {hour}: {count} {stat_type}s\n"
-                            elif group == 'day':
-                                day_of_week, count = row
-                                day_name = ['Sunday', 'Monday', 'Tuesday', 'Wednesday',
-                                            'Thursday', 'Friday', 'Saturday'][int(day_of_week)]
-                                message += f"{i}. {day_name}: {count} {stat_type}s\n"
-                        await ctx.send(message)
+            if stat_type == "duration":
+                await self._calculate_total_listening_time(ctx, timeframe, user)
+                return
+
+            if group == 'song':
+                select_clause = "SELECT media_title, media_url, SUM(count) as count"
+                group_clause = "GROUP BY media_title, media_url"
+            elif group == 'hour':
+                select_clause = "SELECT printf('%02d', hour_ts / 3600 % 24) as hour, SUM(count) as count"
+                group_clause = "GROUP BY hour"
+            elif group == 'day':
+                # 1970-01-01 was a Thursday
+                select_clause = "SELECT (hour_ts / 86400 + 4) % 7 as day_of_week, SUM(count) as count"
+                group_clause = "GROUP BY day_of_week"
+
+            query = f"{select_clause} FROM music_actions_hourly WHERE guild_id = ? AND action = ?"
+            params = [ctx.guild.id, stat_type]
+
+            start = timeframe_start(timeframe)
+            if start is not None:
+                query += " AND hour_ts >= ?"
+                params.append(start)
+
+            if user:
+                query += " AND user_id = ?"
+                params.append(str(user.id))
+
+            query += f" {group_clause} ORDER BY count DESC LIMIT 5"
+
+            data = await self.bot.db.fetchall(query, params)
+
+            if data:
+                if chart == "bar":
+                    title = f"Top {stat_type}s by {group} ({timeframe})"
+                    xlabel = group.title()
+                    ylabel = f"Number of {stat_type}s"
+                    await generate_bar_chart(ctx, data, title=title, xlabel=xlabel, ylabel=ylabel, group=group)
+                elif chart == "pie":
+                    title = f"Top {stat_type}s by {group} ({timeframe})"
+                    await generate_pie_chart(ctx, data, title=title, group=group)
                 else:
-                    await ctx.send("No data available for the selected filters.", delete_after=12)
+                    message = f"**Top {stat_type}s by {group} ({timeframe}):**\n"
+                    for i, row in enumerate(data, start=1):
+                        if group == 'song':
+                            media_title, media_url, count = row
+                            message += f"{i}. [{media_title}](<{media_url}>): {count} {stat_type}s\n"
+                        elif group == 'hour':
+                            hour, count = row
+                            message += f"{i}. Hour {hour}: {count} {stat_type}s\n"
+                        elif group == 'day':
+                            day_of_week, count = row
+                            day_name = ['Sunday', 'Monday', 'Tuesday', 'Wednesday',
+                                        'Thursday', 'Friday', 'Saturday'][int(day_of_week)]
+                            message += f"{i}. {day_name}: {count} {stat_type}s\n"
+                    await ctx.send(message)
+            else:
+                await ctx.send("No data available for the selected filters.", delete_after=12)
         except sqlite3.Error as e:
             await ctx.send(f"An error occurred with the database:\n{str(e)}")
 
-    async def _calculate_total_listening_time(self, ctx, cursor, timeframe, user):
+    async def _calculate_total_listening_time(self, ctx, timeframe, user):
         """
         Calculates the total listening time, both globally and per user.
         """
-        query = "SELECT SUM(playback_speed * duration) as total_time FROM music_actions WHERE action = 'request' AND guild_id = ?"
+        query = "SELECT SUM(listen_seconds) as total_time FROM music_actions_hourly WHERE guild_id = ? AND action = 'request'"
         params = [ctx.guild.id]
 
-        if timeframe == "today":
-            query += " AND DATE(timestamp) = DATE('now')"
-        elif timeframe == "week":
-            query += " AND timestamp >= DATE('now', '-7 days')"
-        elif timeframe == "month":
-            query += " AND timestamp >= DATE('now', '-30 days')"
+        start = timeframe_start(timeframe)
+        if start is not None:
+            query += " AND hour_ts >= ?"
+            params.append(start)
 
         if user:
             query += " AND user_id = ?"
             params.append(str(user.id))
 
-        cursor.execute(query, params)
-        result = cursor.fetchone()
+        result = await self.bot.db.fetchone(query, params)
 
         if result and result[0]:
             total_seconds = result[0]
@@ -670,14 +666,16 @@ class MusicCog(commands.Cog, name="MusicCog", description="Streams audio from th
         """Handles the event when a member's voice state updates."""
         if member == self.bot.user:
             if before.channel and not after.channel:
-                guild = before.channel.guild
-                music_player = await self.bot.music_manager.get_player(guild)
-                await music_player.stop_playing()
+                music_player = self.music_manager.players.get(before.channel.guild.id)
+                if music_player:
+                    # without a voice connection the rest of a playlist has nowhere to play
+                    music_player.cancel_import()
+                    await music_player.call(music_player.stop_playing)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild):
         """Handles the event when the bot is removed from a guild."""
-        await self.bot.music_manager.cleanup_player(guild.id)
+        self.music_manager.cleanup_player(guild.id)
 
 
 async def setup(bot: commands.Bot):
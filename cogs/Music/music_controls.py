@@ -0,0 +1,61 @@
+import discord
+from utils.logger import log_error
+
+
+CONTROL_EMOJIS = {
+    '⏮️': 'previous',
+    '▶️': 'resume',
+    '⏸️': 'pause',
+    '⏹️': 'stop',
+    '⏭️': 'skip',
+    '❤️': 'like',
+}
+
+
+class PlayerControls(discord.ui.View):
+    """
+    Buttons on the player message.
+
+    The view holds no guild state and its custom_ids never change, so one
+    instance registered with `bot.add_view` handles clicks on every guild's
+    player message, including ones sent before a restart.
+    """
+
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    async def _dispatch(self, interaction, action):
+        # the action may take a moment (skip writes to the database), so ack the click first
+        await interaction.response.defer()
+        cog = interaction.client.get_cog('MusicCog')
+        if cog is None or interaction.guild is None:
+            return
+        try:
+            await cog.handle_control(action, interaction.guild, interaction.user, interaction.channel)
+        except Exception as e:
+            log_error(interaction.client,
+                      f"Error handling player control '{action}': {e}")
+
+    @discord.ui.button(emoji='⏮️', style=discord.ButtonStyle.secondary, custom_id='music:previous')
+    async def previous(self, interaction, button):
+        await self._dispatch(interaction, 'previous')
+
+    @discord.ui.button(emoji='▶️', style=discord.ButtonStyle.secondary, custom_id='music:resume')
+    async def resume(self, interaction, button):
+        await self._dispatch(interaction, 'resume')
+
+    @discord.ui.button(emoji='⏸️', style=discord.ButtonStyle.secondary, custom_id='music:pause')
+    async def pause(self, interaction, button):
+        await self._dispatch(interaction, 'pause')
+
+    @discord.ui.button(emoji='⏹️', style=discord.ButtonStyle.danger, custom_id='music:stop')
+    async def stop_playback(self, interaction, button):
+        await self._dispatch(interaction, 'stop')
+
+    @discord.ui.button(emoji='⏭️', style=discord.ButtonStyle.secondary, custom_id='music:skip')
+    async def skip(self, interaction, button):
+        await self._dispatch(interaction, 'skip')
+
+    @discord.ui.button(emoji='❤️', style=discord.ButtonStyle.secondary, custom_id='music:like', row=1)
+    async def like(self, interaction, button):
+        await self._dispatch(interaction, 'like')
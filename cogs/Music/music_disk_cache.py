@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import yt_dlp
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from utils.logger import log_debug, log_error
+from cogs.Music.music_track import TrackInfo
+
+
+def _file_digest(path):
+    """Returns the sha256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _download_audio(webpage_url, cache_dir, video_id):
+    """Downloads a track as an opus file, returning its file name, size and digest."""
+    ydl_opts = {
+        'format': 'bestaudio[acodec=opus]/bestaudio/best',
+        'noplaylist': True,
+        'quiet': True,
+        'outtmpl': str(cache_dir / f'{video_id}.download.%(ext)s'),
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'opus',
+        }],
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        ydl.download([webpage_url])
+
+    downloaded = cache_dir / f'{video_id}.download.opus'
+    final = cache_dir / f'{video_id}.opus'
+    digest = _file_digest(downloaded)
+    os.replace(downloaded, final)
+    return final.name, final.stat().st_size, digest
+
+
+def _render_speed(ffmpeg_path, source_path, cache_dir, entry_key, playback_speed):
+    """Renders a sped up or slowed down copy of a cached file with the same filter live playback uses."""
+    rendering = cache_dir / f'{entry_key}.render.opus'
+    final = cache_dir / f'{entry_key}.opus'
+    subprocess.run([
+        ffmpeg_path, '-y', '-loglevel', 'error',
+        '-i', str(source_path),
+        '-vn', '-filter:a', f'asetrate=48000*{playback_speed},aresample=48000',
+        '-c:a', 'libopus', '-b:a', '128k',
+        str(rendering),
+    ], check=True, stdin=subprocess.DEVNULL, capture_output=True)
+
+    digest = _file_digest(rendering)
+    os.replace(rendering, final)
+    return final.name, final.stat().st_size, digest
+
+
+def _track_metadata(track):
+    # the stream URL expires long before the file does
+    return track.copy(url=None, local_path=None).to_dict()
+
+
+def _entry_key(video_id, playback_speed=1.0):
+    return video_id if playback_speed == 1.0 else f'{video_id}@{playback_speed:g}'
+
+
+class MusicDiskCache:
+    """
+    On-disk LRU cache of opus files for the most requested tracks.
+
+    A track is only downloaded once it has been requested `min_requests`
+    times, and the least recently played files are evicted once the cache
+    grows past `max_bytes`. Cached tracks that get requested at another speed
+    also get a pre-rendered copy at that speed, so /slowplay and /fastplay
+    can stream them without filtering in real time. The index keeps each
+    track's metadata and which searches led to it, so a cached track plays
+    without a yt-dlp lookup even after a restart.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.enabled = self.bot.config.get('audio_cache_enabled', True)
+        self.max_bytes = self.bot.config.get('audio_cache_max_mb', 1024) * 1024 * 1024
+        self.min_requests = self.bot.config.get('audio_cache_min_requests', 3)
+        self.max_track_duration = self.bot.config.get(
+            'audio_cache_max_track_duration', 1200)
+        self.render_speeds = self.bot.config.get('audio_cache_render_speeds', True)
+        self.cache_dir = self.bot.data_dir / 'audio_cache'
+        self.index_file = self.cache_dir / 'index.json'
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='yobot-audio-cache')
+        self.entries = {}
+        self.request_counts = Counter()
+        # normalized search -> video id, most recent last
+        self.queries = {}
+        self.max_queries = 2000
+        self.downloading = set()
+        self.ffmpeg_path = 'ffmpeg.exe' if sys.platform == 'win32' else 'ffmpeg'
+        self._load_index()
+
+    def lookup(self, video_id, playback_speed=1.0):
+        """Returns the path of a cached copy of a track at the given speed, or None."""
+        entry_key = _entry_key(video_id, playback_speed)
+        entry = self.entries.get(entry_key) if self.enabled else None
+        if entry is None:
+            return None
+
+        path = self.cache_dir / entry['file']
+        try:
+            if path.stat().st_size != entry['size']:
+                raise OSError("size mismatch")
+        except OSError:
+            log_error(
+                self.bot, f"Dropping damaged audio cache entry for {entry_key}")
+            self._remove(entry_key)
+            return None
+
+        entry['last_access'] = time.time()
+        return str(path)
+
+    def find(self, query_key):
+        """Returns the cached track a normalized query points to, with its local path set, or None."""
+        # URLs normalize to their video id, searches have to have been seen before
+        video_id = query_key[3:] if query_key.startswith('id:') else self.queries.get(query_key)
+        entry = self.entries.get(video_id) if video_id else None
+        if entry is None or 'track' not in entry:
+            return None
+        local_path = self.lookup(video_id)
+        if local_path is None:
+            return None
+        return TrackInfo(**entry['track']).copy(local_path=local_path, acodec='opus', url=None)
+
+    def remember_query(self, query_key, video_id):
+        """Remembers which video a search resolved to, so `find` can answer it next time."""
+        if not video_id or query_key.startswith('id:'):
+            return
+        self.queries.pop(query_key, None)
+        self.queries[query_key] = video_id
+        if len(self.queries) > self.max_queries:
+            del self.queries[next(iter(self.queries))]
+
+    def record_request(self, track, playback_speed=1.0):
+        """Counts a request for a track and caches it once it is popular enough."""
+        video_id = track.id
+        if not self.enabled or not video_id or not track.webpage_url:
+            return
+
+        self.request_counts[video_id] += 1
+        if video_id in self.entries:
+            # entries from before metadata was kept pick it up on their next request
+            self.entries[video_id].setdefault('track', _track_metadata(track))
+            if playback_speed != 1.0 and self.render_speeds:
+                self._schedule(_entry_key(video_id, playback_speed), _render_speed, self.ffmpeg_path,
+                               self.cache_dir / self.entries[video_id]['file'], self.cache_dir,
+                               _entry_key(video_id, playback_speed), playback_speed)
+            return
+
+        if (self.request_counts[video_id] >= self.min_requests
+                and (track.duration or 0) <= self.max_track_duration):
+            self._schedule(video_id, _download_audio,
+                           track.webpage_url, self.cache_dir, video_id, track=track)
+
+    def _schedule(self, entry_key, job, *args, track=None):
+        """Queues a download or render on the cache worker unless it is already done or pending."""
+        if entry_key in self.entries or entry_key in self.downloading:
+            return
+        self.downloading.add(entry_key)
+        asyncio.create_task(self._admit(entry_key, job, *args, track=track))
+
+    async def _admit(self, entry_key, job, *args, track=None):
+        """Runs a cache job on the worker and evicts old files to stay in budget."""
+        loop = asyncio.get_running_loop()
+        try:
+            file_name, size, digest = await loop.run_in_executor(self.executor, job, *args)
+            self.entries[entry_key] = {
+                'file': file_name,
+                'size': size,
+                'sha256': digest,
+                'last_access': time.time(),
+            }
+            if track:
+                self.entries[entry_key]['track'] = _track_metadata(track)
+            log_debug(
+                self.bot, f"Cached audio for {entry_key} ({size // 1024} KB)")
+            self._evict_to_budget()
+            await loop.run_in_executor(self.executor, self._write_index, self._dump_index())
+        except Exception as e:
+            log_error(self.bot, f"Error caching audio for {entry_key}: {e}")
+        finally:
+            self.downloading.discard(entry_key)
+
+    async def verify(self):
+        """Checks every cached file against its digest, dropping damaged ones."""
+        if not self.enabled:
+            return
+
+        loop = asyncio.get_running_loop()
+        entries = dict(self.entries)
+        damaged = await loop.run_in_executor(self.executor, self._find_damaged, entries)
+        for video_id in damaged:
+            log_error(
+                self.bot, f"Dropping damaged audio cache entry for {video_id}")
+            self._remove(video_id)
+        if damaged:
+            await loop.run_in_executor(self.executor, self._write_index, self._dump_index())
+
+    def total_size(self):
+        return sum(entry['size'] for entry in self.entries.values())
+
+    def _find_damaged(self, entries):
+        damaged = []
+        for video_id, entry in entries.items():
+            path = self.cache_dir / entry['file']
+            try:
+                if path.stat().st_size != entry['size'] or _file_digest(path) != entry['sha256']:
+                    damaged.append(video_id)
+            except OSError:
+                damaged.append(video_id)
+        return damaged
+
+    def _evict_to_budget(self):
+        total = self.total_size()
+        for video_id in sorted(self.entries, key=lambda key: self.entries[key]['last_access']):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries[video_id]['size']
+            log_debug(self.bot, f"Evicting cached audio for {video_id}")
+            self._remove(video_id)
+
+    def _remove(self, video_id):
+        entry = self.entries.pop(video_id, None)
+        if entry:
+            try:
+                os.remove(self.cache_dir / entry['file'])
+            except OSError:
+                pass
+
+    def _load_index(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+            self.entries = index.get('entries', {})
+            self.request_counts.update(index.get('request_counts', {}))
+            self.queries = index.get('queries', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log_error(self.bot, f"Error reading audio cache index: {e}")
+
+    def _dump_index(self):
+        # only remember counts for the tracks that could plausibly be admitted
+        return json.dumps({
+            'entries': self.entries,
+            'request_counts': dict(self.request_counts.most_common(1000)),
+            'queries': self.queries,
+        })
+
+    def _write_index(self, data):
+        temp_file = self.index_file.with_suffix('.tmp')
+        with open(temp_file, 'w') as f:
+            f.write(data)
+        os.replace(temp_file, self.index_file)
+
+    def shutdown(self):
+        """Saves the index and stops the download worker."""
+        try:
+            self._write_index(self._dump_index())
+        except OSError as e:
+            log_error(self.bot, f"Error saving audio cache index: {e}")
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,23 +1,120 @@
-from utils.logger import log_debug
+import asyncio
+import sys
+import time
+from utils.logger import log_debug, log_error
 from cogs.Music.music_player import MusicPlayer
+from cogs.Music.music_resolver import MusicResolver
+from cogs.Music.music_progress import ProgressScheduler
+from cogs.Music.music_controls import PlayerControls
+from cogs.Music.music_metrics import PlaybackMetrics
+from cogs.Music.music_snapshot import MusicSnapshot
+from cogs.Music.music_track import TrackInfo
+
+
+def _estimate_player_bytes(player):
+    """Roughly estimates the memory held by a player, its queue and current track."""
+    size = sys.getsizeof(player) + sys.getsizeof(player.__dict__)
+    for entry in player.queue:
+        size += sys.getsizeof(entry) + sys.getsizeof(entry.url) + sys.getsizeof(entry.title)
+    track = player.current_video_info
+    if track:
+        size += sys.getsizeof(track) + sum(sys.getsizeof(getattr(track, field))
+                                           for field in TrackInfo.__slots__)
+    return size
+
 
 class MusicManager:
+    """
+    Owns every guild's MusicPlayer and the services they share.
+
+    Players are created on demand and evicted once they have sat idle for
+    `player_idle_ttl` seconds, so the registry only holds guilds that are
+    actually using music.
+    """
+
     def __init__(self, bot):
         self.bot = bot
         self.players = {}
+        # message id -> guild id of every live player message
+        self.player_messages = {}
+        self.resolver = MusicResolver(bot)
+        self.progress = ProgressScheduler(bot)
+        self.controls = PlayerControls()
+        self.metrics = PlaybackMetrics()
+        self.snapshots = MusicSnapshot(bot, self)
+        self.idle_ttl = self.bot.config.get('player_idle_ttl', 600)
+        self.sweep_interval = self.bot.config.get('player_sweep_interval', 60)
+        self.sweeper = None
+        self.evicted = 0
 
     async def get_player(self, guild):
         """Retrieve the MusicPlayer for a guild, creating one if it doesn't exist."""
         if guild.id not in self.players:
             self.players[guild.id] = self.create_player(guild)
-        return self.players[guild.id]
-    
+        player = self.players[guild.id]
+        player.last_active = time.monotonic()
+        return player
+
+    def peek_player(self, guild_id):
+        """Returns the MusicPlayer for a guild if it has one, without creating it."""
+        return self.players.get(guild_id)
+
     def create_player(self, guild):
         """Method to create a MusicPlayer instance for a guild."""
-        return MusicPlayer(self.bot, guild, self)
-    
+        player = MusicPlayer(self.bot, guild, self)
+        self.snapshots.restore_player(player)
+        return player
+
     def cleanup_player(self, guild_id):
-        """Remove the MusicPlayer instance for a guild."""
-        if guild_id in self.players:
-            del self.players[guild_id]
-            log_debug(self.bot, f"Cleaned up MusicPlayer for guild ID: {guild_id}")
\ No newline at end of file
+        """Remove the MusicPlayer instance for a guild, canceling its tasks."""
+        player = self.players.pop(guild_id, None)
+        if player:
+            player.shutdown()
+            log_debug(self.bot, f"Cleaned up MusicPlayer for guild ID: {guild_id}")
+
+    def start(self):
+        """Restores the last snapshot and starts the background sweep that evicts idle players."""
+        self.snapshots.load()
+        self.snapshots.start()
+        if self.sweeper is None or self.sweeper.done():
+            self.sweeper = asyncio.create_task(self._sweep_idle_players())
+
+    async def _sweep_idle_players(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                log_error(self.bot, f"Error evicting idle music players: {e}")
+
+    def evict_idle(self):
+        """Evicts players that have had nothing to do for longer than the idle TTL."""
+        cutoff = time.monotonic() - self.idle_ttl
+        idle = [guild_id for guild_id, player in self.players.items()
+                if player.last_active < cutoff and player.is_idle()]
+        for guild_id in idle:
+            self.cleanup_player(guild_id)
+        self.evicted += len(idle)
+        return len(idle)
+
+    def stats(self):
+        """Returns player counts and a rough estimate of the memory they hold."""
+        players = list(self.players.values())
+        return {
+            'players': len(players),
+            'playing': sum(1 for player in players if player.is_playing),
+            'idle': sum(1 for player in players if player.is_idle()),
+            'queued': sum(len(player.queue) for player in players),
+            'player_messages': len(self.player_messages),
+            'evicted': self.evicted,
+            'pending_restores': len(self.snapshots.pending),
+            'estimated_bytes': sum(_estimate_player_bytes(player) for player in players),
+        }
+
+    def shutdown(self):
+        """Saves a final snapshot, then stops the sweep and every shared service."""
+        self.snapshots.shutdown()
+        if self.sweeper and not self.sweeper.done():
+            self.sweeper.cancel()
+        self.progress.shutdown()
+        self.resolver.shutdown()
@@ -0,0 +1,36 @@
+from collections import deque
+
+
+class PlaybackMetrics:
+    """Counts track-end errors and how long the next track takes to start once one ends."""
+
+    def __init__(self, sample_size=500):
+        self.track_errors = 0
+        self.advance_errors = 0
+        self.stale_ends = 0
+        self.gaps = deque(maxlen=sample_size)
+        self.prepared_starts = 0
+
+    def record_gap(self, seconds, prepared=False):
+        """Records the time between a track ending and the next one starting."""
+        self.gaps.append(seconds)
+        if prepared:
+            self.prepared_starts += 1
+
+    def stats(self):
+        """Returns error counters and next-track latency percentiles in seconds."""
+        gaps = sorted(self.gaps)
+
+        def percentile(fraction):
+            return round(gaps[min(int(len(gaps) * fraction), len(gaps) - 1)], 3) if gaps else None
+
+        return {
+            'track_errors': self.track_errors,
+            'advance_errors': self.advance_errors,
+            'stale_ends': self.stale_ends,
+            'transitions': len(gaps),
+            'prepared_starts': self.prepared_starts,
+            'gap_p50': percentile(0.5),
+            'gap_p95': percentile(0.95),
+            'gap_max': round(gaps[-1], 3) if gaps else None,
+        }
@@ -1,14 +1,14 @@
 import discord
 import sqlite3
-import yt_dlp
 import asyncio
 import time
-import re
 import os
 import sys
 from discord.ext import commands, tasks
 from utils.tools import format_time, generate_progress_bar
 from utils.logger import log_error, log_debug
+from cogs.Music.music_resolver import ExtractorBusyError
+from cogs.Music.music_queue import PlaybackQueue, QueueEntry, QueueFullError
 
 
 class MusicPlayer:
@@ -16,11 +16,26 @@ class MusicPlayer:
         self.bot = bot
         self.guild = guild
         self.manager = manager
-        self.queue = []
+        self.queue = PlaybackQueue(
+            capacity=self.bot.config.get('queue_capacity', 100),
+            fair=self.bot.config.get('queue_fair_mode', False))
         self.current_video_info = None
-        self.player_message = None
+        self._player_message = None
         self.is_playing = False
         self.current_media_url = None
+        self.resolve_task = None
+        self.import_task = None
+        self.prefetch_task = None
+        self.prefetch_depth = self.bot.config.get('prefetch_depth', 2)
+        self.track_started_at = None
+        self.paused_at = None
+        self.current_requester = None
+        self.current_playback_speed = 1.0
+        self.handover_task = None
+        self.next_source = None
+        self.handover_lead = self.bot.config.get('gapless_handover_lead', 5)
+        self.volume = self.bot.config['media_volume'] / 100
+        self.opus_passthrough = self.bot.config.get('opus_passthrough', True)
         self.max_media_duration = self.bot.config['max_media_duration']
         self.player_icon = ':notes: '
         if sys.platform == 'win32':
@@ -29,232 +44,594 @@ class MusicPlayer:
             self.ffmpeg_path = 'ffmpeg'
         self.disconnect_timer = None
         self.inactivity_duration = self.bot.config['inactivity_duration']
-
-    async def create_player_embed(self, channel, url, title, playback_speed=1.0, thumbnail='https://i.imgur.com/tSuXN8P.png', requester=None):
-        """Creates or updates the player embed."""
-        if playback_speed > 1.0:
+        self.keep_warm = self.bot.config.get('voice_keep_warm', 0)
+        self.mailbox = asyncio.Queue()
+        self.actor_task = None
+        self.track_generation = 0
+        self.track_ended_at = None
+        self.last_active = time.monotonic()
+
+    def post(self, operation, *args):
+        """
+        Queues an operation on the player, returning a future for its result.
+
+        Every state change (playing, queueing, skipping, stopping, track
+        completion) runs through this mailbox one at a time, so they never
+        interleave with each other. The consumer task only lives while there
+        is work, so idle players cost nothing.
+        """
+        self.last_active = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self.mailbox.put_nowait((operation, args, future))
+        if self.actor_task is None or self.actor_task.done():
+            self.actor_task = asyncio.create_task(self._run_mailbox())
+        return future
+
+    async def call(self, operation, *args):
+        """Runs an operation on the player and waits for its result."""
+        return await self.post(operation, *args)
+
+    async def _run_mailbox(self):
+        while not self.mailbox.empty():
+            operation, args, future = self.mailbox.get_nowait()
+            if future.done():
+                # the caller gave up before its turn came
+                continue
+            try:
+                result = await operation(*args)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    @property
+    def player_message(self):
+        return self._player_message
+
+    @player_message.setter
+    def player_message(self, message):
+        # keep the manager's index of player messages in step for reaction routing
+        if self._player_message:
+            self.manager.player_messages.pop(self._player_message.id, None)
+        if message:
+            self.manager.player_messages[message.id] = self.guild.id
+        self._player_message = message
+
+    def build_player_embed(self, elapsed_time=0):
+        """Builds the player embed for the current track at the given position."""
+        info = self.current_video_info
+        if self.current_playback_speed > 1.0:
             player_title = f"{self.player_icon} Fast Playing"
-        elif playback_speed < 1.0:
+        elif self.current_playback_speed < 1.0:
             player_title = f"{self.player_icon} Slow Playing"
         else:
             player_title = f"{self.player_icon} Now Playing"
         embed = discord.Embed(
             title=player_title,
-            description=f"[{title}]({url})",
+            description=f"[{info.title}]({info.webpage_url})",
             color=discord.Color.blurple()
         )
-        if thumbnail:
-            embed.set_thumbnail(url=thumbnail)
-        else:
-            embed.set_thumbnail(url="https://i.imgur.com/tSuXN8P.png")
+        embed.set_thumbnail(
+            url=info.thumbnail or "https://i.imgur.com/tSuXN8P.png")
 
-        if len(self.queue) > 0:
-            next_url, _ = self.queue[0]
-            next_song_field = f"[Next Song]({next_url})"
+        next_song_field = self._up_next_field()
+        if next_song_field:
             embed.add_field(
                 name="Up Next", value=next_song_field, inline=False)
 
-        embed.add_field(name="Progress",
-                        value="[00:00] ▰▰▰▱▱▱▱▱▱▱ 00:00", inline=False)
+        duration = info.duration / self.current_playback_speed
+        elapsed_time = min(elapsed_time, duration)
+        progress_bar = generate_progress_bar(
+            elapsed_time / duration if duration else 0)
+        embed.add_field(
+            name="Progress",
+            value=f"[{format_time(elapsed_time)}] {progress_bar} {format_time(duration)}",
+            inline=False
+        )
         embed.set_footer(
-            text=f"Requested by {requester.display_name}" if requester else "Requested by someone")
+            text=f"Requested by {self.current_requester.display_name}" if self.current_requester else "Requested by someone")
+        return embed
+
+    def player_embed_key(self, elapsed_time=0):
+        """Returns what the player embed visibly shows, counting progress in bar segments rather than seconds."""
+        info = self.current_video_info
+        duration = info.duration / self.current_playback_speed
+        progress = min(elapsed_time, duration) / duration if duration else 0
+        requester = self.current_requester.display_name if self.current_requester else None
+        return (info.webpage_url, info.title, self.current_playback_speed,
+                self._up_next_field(), generate_progress_bar(progress), requester)
+
+    async def create_player_embed(self, channel):
+        """Creates the player message, or edits the existing one for a new track."""
+        embed = self.build_player_embed()
 
         if self.player_message:
             try:
+                # the buttons are already on the message, so a new track is one edit
                 await self.player_message.edit(embed=embed)
             except discord.NotFound:
-                self.player_message = await channel.send(embed=embed)
-        else:
-            self.player_message = await channel.send(embed=embed)
+                self.player_message = None
 
-        reactions = ['⏮️', '▶️', '⏸️', '⏹️', '⏭️', '❤️']
-        for reaction in reactions:
+        if self.player_message is None:
             try:
-                await self.player_message.add_reaction(reaction)
+                self.player_message = await channel.send(embed=embed, view=self.manager.controls)
             except discord.Forbidden:
                 log_error(
-                    self.bot, f"Missing permissions to add reactions in {channel.name}")
-                break
+                    self.bot, f"Missing permissions to send the player in {channel.name}")
 
         await self.cancel_disconnect_timer()
 
-    async def update_progress_bar(self, voice_client, video_info, playback_speed=1.0, requester=None, thumbnail=None):
-        """Updates the progress bar as the song plays."""
-        duration = video_info['duration'] / playback_speed
-        title, url = video_info['title'], video_info['webpage_url']
-        start_time = time.time()
-        if playback_speed > 1.0:
-            player_title = f"{self.player_icon} Fast Playing"
-        elif playback_speed < 1.0:
-            player_title = f"{self.player_icon} Slow Playing"
-        else:
-            player_title = f"{self.player_icon} Now Playing"
-        while voice_client.is_playing():
-            elapsed_time = time.time() - start_time
-            progress_percentage = min(elapsed_time / duration, 1.0)
-            progress_bar = generate_progress_bar(progress_percentage)
-
-            embed = discord.Embed(
-                title=player_title,
-                description=f"[{title}]({url})",
-                color=discord.Color.blurple()
-            )
-            if thumbnail:
-                embed.set_thumbnail(url=thumbnail)
-            else:
-                embed.set_thumbnail(url="https://i.imgur.com/tSuXN8P.png")
-            embed.set_footer(
-                text=f"Requested by {requester.display_name}" if requester else "Requested by someone")
-
-            embed.clear_fields()
-            if len(self.queue) > 0:
-                next_song = self.queue[0]
-                next_url = next_song[0]
-                if not next_url.startswith('http'):
-                    next_song_field = f"[{next_url}]"
-                    embed.add_field(
-                        name="Up Next", value=next_song_field, inline=False)
-                else:
-                    next_song_field = f"[Next Song]({next_url})"
-                    embed.add_field(
-                        name="Up Next", value=next_song_field, inline=False)
-
-            embed.add_field(
-                name="Progress",
-                value=f"[{format_time(elapsed_time)}] {progress_bar} {format_time(duration)}",
-                inline=False
-            )
-
-            if self.player_message:
-                try:
-                    await self.player_message.edit(embed=embed)
-                except discord.NotFound:
-                    self.player_message = None
-                    break
-
-            await asyncio.sleep(5)
-
-            if elapsed_time >= duration:
-                break
-
-    async def play_youtube_audio(self, channel, voice_client, media_url=None, playback_speed=1.0, volume=0.2, requester=None):
-        """Plays YouTube audio and updates the player UI."""
+    async def play_youtube_audio(self, channel, voice_client, media_url=None, playback_speed=1.0, volume=0.2, requester=None, prepared=None, start_at=0, record=True):
+        """Plays YouTube audio and updates the player UI, counting it as a request unless `record` is False."""
         await self.cancel_disconnect_timer()
 
-        url_regex = re.compile(
-            r'^(https?://)?(www\.)?(youtube\.com|youtu\.?be)/.+$')
-        search_query = media_url if media_url and url_regex.match(
-            media_url) else f'ytsearch1:{media_url}'
-
         self.current_playback_speed = playback_speed
-
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'noplaylist': True,
-            'quiet': True,
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'opus',
-                'preferredquality': '198',
-            }],
-            'writethumbnail': True,
-            'outtmpl': 'thumbnails/%(id)s.%(ext)s',
-        }
+        self.volume = volume
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(search_query, download=False)
-                info = info['entries'][0] if 'entries' in info else info
-                media_url = info.get('url')
-                genre = info.get('genre', 'Unknown')
+            if prepared:
+                # the next track was resolved and its ffmpeg source spawned ahead of time
+                info, source = prepared['info'], prepared['source']
+            else:
+                info = await self._resolve_track(media_url)
+                if info is None:
+                    log_debug(
+                        self.bot, f"Track lookup canceled for guild: {self.guild.name} ({self.guild.id})")
+                    self.is_playing = False
+                    return
 
-                if info.get('duration') > self.max_media_duration:
+                if info.duration > self.max_media_duration:
                     await channel.send("Sorry, I can't play songs longer than 2 hours.", delete_after=12)
+                    self.is_playing = False
                     return
 
-                if not media_url:
-                    raise ValueError("Failed to extract media URL")
-
-                with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                    cursor = conn.cursor()
-
-                    media_title = info['title']
-
-                    cursor.execute('''
-                        INSERT INTO music_actions (
-                            guild_id,
-                            user_id,
-                            user_name,
-                            media_title,
-                            media_url,
-                            genre,
-                            playback_speed,
-                            duration,
-                            action
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'request')
-                    ''', (
-                        self.guild.id,
-                        requester.id if requester else None,
-                        requester.display_name if requester else 'Unknown',
-                        media_title,
-                        info['webpage_url'],
-                        genre,
-                        playback_speed,
-                        info['duration']
-                    ))
-
-                    conn.commit()
-
-                    thumbnail_url = info['thumbnail']
-                    self.current_video_info = info
-                    self.current_media_url = self.current_video_info['webpage_url']
-
-                    await self.create_player_embed(channel, info['webpage_url'], info['title'], playback_speed, thumbnail_url, requester)
-
-                    ffmpeg_options = self._get_ffmpeg_options(playback_speed)
-                    source = discord.FFmpegPCMAudio(
-                        media_url, executable=self.ffmpeg_path, **ffmpeg_options)
-
-                    voice_client.play(discord.PCMVolumeTransformer(
-                        source, volume=volume), after=self._after_play)
-
-                    self.is_playing = True
-                    asyncio.create_task(self.update_progress_bar(
-                        voice_client, info, playback_speed, requester, thumbnail_url))
+                source = self._build_source(
+                    info, playback_speed, volume, start_at)
 
-        except sqlite3.Error as e:
-            log_error(self.bot, f"SQLite Error in play_youtube_audio: {e}")
+            # start the audio before any REST calls so the handover stays gapless
+            self.track_generation += 1
+            generation = self.track_generation
+            try:
+                voice_client.play(
+                    source, after=lambda error: self._after_play(error, generation))
+            except Exception:
+                # the source's ffmpeg process is already running, e.g. a prefetched one
+                source.cleanup()
+                raise
+            if self.track_ended_at:
+                self.manager.metrics.record_gap(
+                    time.monotonic() - self.track_ended_at, prepared=prepared is not None)
+                self.track_ended_at = None
+            if record:
+                self.manager.resolver.disk_cache.record_request(
+                    info, playback_speed)
+
+            self.is_playing = True
+            # start_at is a position in the source, so it plays faster or slower than real time
+            self.track_started_at = time.time() - start_at / playback_speed
+            self.paused_at = None
+            self.current_video_info = info
+            self.current_requester = requester
+            self.current_media_url = info.webpage_url
+            self.start_prefetch()
+            self._schedule_handover()
+
+            if record:
+                await self._record_request(info, playback_speed, requester)
+
+            await self.create_player_embed(channel)
+            self.manager.progress.track(self)
+
+        except asyncio.TimeoutError:
+            await channel.send("Sorry, looking up that song took too long. Try again in a bit.", delete_after=12)
+            log_error(
+                self.bot, f"Timed out resolving {media_url} in guild '{self.guild.name}'")
+            self.is_playing = False
+        except ExtractorBusyError as e:
+            await channel.send("Sorry, I'm busy looking up other songs. Try again in a bit.", delete_after=12)
+            log_error(self.bot, f"Extractor busy in play_youtube_audio: {e}")
+            self.is_playing = False
         except Exception as e:
             log_error(self.bot, f"Error in play_youtube_audio: {e}")
+            self.is_playing = voice_client.is_playing()
 
-    def _after_play(self, error):
+    async def _record_request(self, info, playback_speed, requester):
+        """Adds a request to the music stats, without letting a database error get in the way of playback."""
+        if requester is None:
+            # the requester left the guild, there is nobody to count it for
+            return
+        try:
+            await self.bot.db.execute('''
+                INSERT INTO music_actions (
+                    guild_id,
+                    user_id,
+                    user_name,
+                    media_title,
+                    media_url,
+                    genre,
+                    playback_speed,
+                    duration,
+                    action,
+                    created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'request', ?)
+            ''', (
+                self.guild.id,
+                requester.id,
+                requester.display_name,
+                info.title,
+                info.webpage_url,
+                info.genre,
+                playback_speed,
+                info.duration,
+                int(time.time())
+            ))
+        except sqlite3.Error as e:
+            log_error(self.bot, f"SQLite Error recording request: {e}")
+
+    async def _resolve_track(self, media_query):
+        """Resolves a query in the shared extractor pool, returning None if canceled."""
+        task = asyncio.ensure_future(
+            self.manager.resolver.resolve(media_query))
+        self.resolve_task = task
+        try:
+            # wait without forwarding our own cancellation so a stop/skip that
+            # cancels the lookup doesn't look like the command was canceled
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if self.resolve_task is task:
+                self.resolve_task = None
+
+        if task.cancelled():
+            return None
+        return task.result()
+
+    def cancel_resolve(self):
+        """Cancels the track lookup in progress, if any."""
+        if self.resolve_task and not self.resolve_task.done():
+            self.resolve_task.cancel()
+            return True
+        return False
+
+    def cancel_import(self):
+        """Stops adding songs from a playlist, if one is being imported."""
+        if self.import_task and not self.import_task.done():
+            self.import_task.cancel()
+        self.import_task = None
+
+    def is_importing(self):
+        """Returns True while songs from a playlist are still being added."""
+        return self.import_task is not None and not self.import_task.done()
+
+    def start_prefetch(self):
+        """Starts resolving the next few queued songs in the background."""
+        self.cancel_prefetch()
+        if self.prefetch_depth > 0 and self.queue:
+            self.prefetch_task = asyncio.create_task(self._prefetch_upcoming())
+
+    def cancel_prefetch(self):
+        """Cancels the background prefetch, if any."""
+        if self.prefetch_task and not self.prefetch_task.done():
+            self.prefetch_task.cancel()
+        self.prefetch_task = None
+
+    async def _prefetch_upcoming(self):
+        """Resolves upcoming queue entries so the next track starts without a lookup."""
+        starts_in = self._remaining_time()
+        # index into the live queue so entries added meanwhile are picked up too
+        for index in range(self.prefetch_depth):
+            upcoming = self.queue.peek(index + 1)
+            if index >= len(upcoming):
+                break
+            entry = upcoming[index]
+            try:
+                # ask for a stream URL that is still valid when the entry comes up
+                track = await self.manager.resolver.resolve(
+                    entry.url, min_stream_ttl=starts_in, background=True)
+            except asyncio.CancelledError:
+                raise
+            except ExtractorBusyError:
+                # the rest would be turned away too, leave the extractor to /play
+                log_debug(self.bot, "Extractor busy, stopping prefetch")
+                return
+            except Exception as e:
+                log_debug(self.bot, f"Prefetch failed for {entry.url}: {e}")
+                continue
+            entry.title = track.title or entry.title
+            starts_in += track.duration / entry.playback_speed
+
+    def elapsed_time(self):
+        """Returns how many seconds of the current track have played, not counting pauses."""
+        if not self.track_started_at:
+            return 0
+        return (self.paused_at or time.time()) - self.track_started_at
+
+    def _remaining_time(self):
+        """Returns roughly how many seconds are left in the current track."""
+        if not self.current_video_info or not self.track_started_at:
+            return 0
+        duration = self.current_video_info.duration / self.current_playback_speed
+        return max(duration - self.elapsed_time(), 0)
+
+    def pause(self, voice_client):
+        """Pauses playback, freezing the progress bar."""
+        if voice_client.is_playing():
+            voice_client.pause()
+            self.paused_at = time.time()
+
+    def resume(self, voice_client):
+        """Resumes playback, shifting the track start past the pause."""
+        if voice_client.is_paused():
+            voice_client.resume()
+            if self.paused_at and self.track_started_at:
+                self.track_started_at += time.time() - self.paused_at
+            self.paused_at = None
+            self.manager.progress.wake(self)
+
+    def _schedule_handover(self):
+        """Arranges for the next track's source to be spawned shortly before this one ends."""
+        self.cancel_handover()
+        self.handover_task = asyncio.create_task(self._prepare_next_source())
+
+    def cancel_handover(self):
+        """Cancels the pending handover and tears down any pre-spawned source."""
+        if self.handover_task and not self.handover_task.done():
+            self.handover_task.cancel()
+        self.handover_task = None
+        self.discard_next_source()
+
+    def discard_next_source(self):
+        """Cleans up a pre-spawned source that will not be played."""
+        if self.next_source:
+            self.next_source['source'].cleanup()
+            self.next_source = None
+
+    async def _prepare_next_source(self):
+        """Resolves the next queue entry and spawns its ffmpeg source ahead of time."""
+        try:
+            remaining = self._remaining_time()
+            while remaining > self.handover_lead:
+                await asyncio.sleep(remaining - self.handover_lead)
+                remaining = self._remaining_time()
+
+            entry = self.queue.head()
+            if entry is None:
+                return
+
+            info = await self.manager.resolver.resolve(
+                entry.url, min_stream_ttl=self.handover_lead + 60, background=True)
+            if info.duration > self.max_media_duration:
+                return
+
+            source = self._build_source(info, entry.playback_speed, self.volume)
+            if self.queue.head() is entry:
+                self.discard_next_source()
+                self.next_source = {
+                    'entry': entry, 'info': info, 'source': source}
+                log_debug(
+                    self.bot, f"Pre-spawned next source for guild: {self.guild.name} ({self.guild.id})")
+            else:
+                # the queue moved on while we were resolving
+                source.cleanup()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log_debug(self.bot, f"Failed to prepare next source: {e}")
+
+    def _take_next_source(self, entry):
+        """Returns the pre-spawned source for an entry, discarding one for anything else."""
+        prepared = self.next_source
+        if prepared and prepared['entry'] is entry:
+            self.next_source = None
+            return prepared
+        self.discard_next_source()
+        return None
+
+    def _up_next_field(self):
+        """Returns the "Up Next" embed value for the head of the queue, or None."""
+        entry = self.queue.head()
+        if entry is None:
+            return None
+        if entry.url.startswith('http'):
+            return f"[{entry.title if entry.title != entry.url else 'Next Song'}]({entry.url})"
+        return f"[{entry.title}]"
+
+    def _after_play(self, error, generation):
         """Callback function to be called after a song finishes playing."""
+        # this runs on discord.py's audio thread, so hand the work to the loop and return
+        ended_at = time.monotonic()
+        try:
+            self.bot.loop.call_soon_threadsafe(
+                self._on_track_end, error, generation, ended_at)
+        except RuntimeError:
+            # the loop is already closed during shutdown
+            pass
+
+    def _on_track_end(self, error, generation, ended_at):
         if error:
+            self.manager.metrics.track_errors += 1
             log_error(self.bot, f"Error in after_play: {error}")
-        future = asyncio.run_coroutine_threadsafe(
-            self._play_next_in_queue(), self.bot.loop)
-        try:
-            future.result()
-        except Exception as e:
-            log_error(self.bot, f"Error in _play_next_in_queue: {e}")
+        self.post(self._track_finished, generation, ended_at).add_done_callback(
+            self._log_advance_error)
 
-    async def add_to_queue(self, ctx, url, playback_speed=1.0):
-        self.queue.append((url, playback_speed, ctx.author, ctx.channel))
+    def _log_advance_error(self, future):
+        if not future.cancelled() and future.exception():
+            self.manager.metrics.advance_errors += 1
+            log_error(
+                self.bot, f"Error in _play_next_in_queue: {future.exception()}")
+
+    async def _track_finished(self, generation, ended_at):
+        """Moves on to the next song, unless the track that ended was already stopped or replaced."""
+        if generation != self.track_generation:
+            self.manager.metrics.stale_ends += 1
+            log_debug(
+                self.bot, f"Ignoring stale track end for guild: {self.guild.name} ({self.guild.id})")
+            return
+        self.track_ended_at = ended_at
+        try:
+            await self._play_next_in_queue()
+        finally:
+            self.track_ended_at = None
+
+    async def request(self, channel, voice_client, entry, volume):
+        """Plays an entry right away when nothing is playing, otherwise queues it."""
+        if self.is_playing:
+            await self.enqueue(entry)
+            return False
+
+        self.is_playing = True
+        await self.play_youtube_audio(channel, voice_client, entry.url, entry.playback_speed, volume=volume, requester=entry.requester)
+        return True
+
+    async def skip(self, voice_client):
+        """Ends the current track, which moves on to the next song in the queue."""
+        if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
+            voice_client.stop()
+        else:
+            # the lookup for this song was canceled before it started playing
+            await self._play_next_in_queue()
+
+    async def stop(self, voice_client):
+        """Stops playback and clears the queue."""
+        self.cancel_import()
+        self.queue.clear()
+        if voice_client:
+            voice_client.stop()
+        await self.stop_playing()
+
+    async def clear(self):
+        """Clears the queue without touching the current song."""
+        self.cancel_import()
+        self.queue.clear()
+        self.cancel_prefetch()
+        self.cancel_handover()
+
+    async def set_volume(self, volume):
+        """Sets the volume for the songs that start from now on."""
+        self.volume = volume
+        if self.is_playing:
+            # a pre-spawned next source still has the old volume baked in
+            self._schedule_handover()
+
+    async def add_to_queue(self, ctx, url, playback_speed=1.0, title=None):
+        await self.enqueue(QueueEntry(url, playback_speed, ctx.author, ctx.channel, title=title))
+
+    async def enqueue(self, entry):
+        """Adds an entry to the queue, raising QueueFullError when it is at capacity."""
+        self.queue.push(entry)
+        prefetching = self.prefetch_task and not self.prefetch_task.done()
+        # in fair mode a new requester's song can land ahead of older entries
+        if self.is_playing and not prefetching and entry in self.queue.peek(self.prefetch_depth):
+            self.start_prefetch()
+        if self.is_playing and self.queue.head() is entry:
+            self._schedule_handover()
 
     async def stop_playing(self):
-        """Stops the music player and clears the state."""
+        """Stops the music player and clears the state, leaving a playlist import running."""
+        # the queue may only be empty until the import's next chunk comes in
+        self.cancel_resolve()
+        self.cancel_prefetch()
+        self.cancel_handover()
+        self.manager.progress.untrack(self)
+        # the track that was playing must not start the next song when it ends
+        self.track_generation += 1
         await self.delete_player_embed()
         self.is_playing = False
         self.current_video_info = None
         self.current_media_url = None
         await self.start_disconnect_timer()
-        self.manager.cleanup_player(self.guild.id)
+
+    def is_idle(self):
+        """Returns True when nothing is playing, queued, pending or scheduled on the player."""
+        tasks = (self.actor_task, self.resolve_task,
+                 self.import_task, self.disconnect_timer)
+        return (not self.is_playing and self.queue.is_empty() and self.mailbox.empty()
+                and all(task is None or task.done() for task in tasks))
+
+    def snapshot(self):
+        """Returns the current track and queue as plain data, or None when there is nothing to keep."""
+        if not self.is_playing and self.queue.is_empty():
+            return None
+
+        voice_client = self.guild.voice_client
+        track = self.current_video_info
+        playing = None
+        if self.is_playing and track:
+            playing = {
+                'url': track.webpage_url,
+                'title': track.title,
+                'speed': self.current_playback_speed,
+                # position in the source, elapsed time is scaled by the playback speed
+                'position': round(self.elapsed_time() * self.current_playback_speed, 1),
+                'requester_id': self.current_requester.id if self.current_requester else None,
+            }
+        return {
+            'guild_id': self.guild.id,
+            'text_channel_id': self.player_message.channel.id if self.player_message else None,
+            'voice_channel_id': voice_client.channel.id if voice_client and voice_client.channel else None,
+            'playing': playing,
+            'queue': [{
+                'url': entry.url,
+                'title': entry.title,
+                'speed': entry.playback_speed,
+                'requester_id': entry.requester_id,
+                'channel_id': entry.channel.id if entry.channel else None,
+            } for entry in self.queue],
+        }
+
+    def restore_queue(self, state):
+        """Refills the queue from a snapshot, dropping songs whose channel is gone."""
+        fallback = self.guild.get_channel(state.get('text_channel_id') or 0)
+        restored = 0
+        for item in state['queue']:
+            channel = self.guild.get_channel(item['channel_id'] or 0) or fallback
+            if channel is None:
+                continue
+            requester = self.guild.get_member(item['requester_id'] or 0)
+            try:
+                self.queue.push(QueueEntry(
+                    item['url'], item['speed'], requester, channel, title=item['title']))
+            except QueueFullError:
+                break
+            restored += 1
+        return restored
+
+    async def resume_snapshot(self, voice_client, state):
+        """Starts the track from a snapshot again, close to where it was cut off."""
+        playing = state.get('playing')
+        channel = self.guild.get_channel(state.get('text_channel_id') or 0)
+        if self.is_playing or not playing or channel is None:
+            return False
+
+        self.is_playing = True
+        requester = self.guild.get_member(playing['requester_id'] or 0)
+        await self.play_youtube_audio(channel, voice_client, playing['url'], playing['speed'], volume=self.volume,
+                                      requester=requester, start_at=playing['position'], record=False)
+        return self.is_playing
+
+    def shutdown(self):
+        """Cancels every task the player owns so it can be dropped."""
+        self.cancel_resolve()
+        self.cancel_import()
+        self.cancel_prefetch()
+        self.cancel_handover()
+        self.manager.progress.untrack(self)
+        for task in (self.actor_task, self.disconnect_timer):
+            if task and not task.done():
+                task.cancel()
+        self.actor_task = None
+        self.disconnect_timer = None
+        # leave the message itself alone, just stop routing reactions to it
+        self.player_message = None
 
     async def delete_player_embed(self):
         if self.player_message:
             try:
                 await self.player_message.delete()
-                self.player_message = None
 
             except Exception as e:
                 if isinstance(e, (discord.NotFound, discord.HTTPException)):
@@ -262,31 +639,76 @@ class MusicPlayer:
                         self.bot, f"Failed to delete player message: {str(e)}")
                 else:
                     pass
+            self.player_message = None
 
-    def _get_ffmpeg_options(self, playback_speed):
-        """Returns the appropriate FFmpeg options depending on the playback speed."""
-        preload_time = 1  # seconds
+    def _build_source(self, info, playback_speed, volume, start_at=0):
+        """Builds the audio source for a resolved track, preferring cached files."""
+        media_url = info.local_path or info.url
+        if not media_url:
+            raise ValueError("Failed to extract media URL")
+
+        if playback_speed != 1.0:
+            rendered_path = self.manager.resolver.disk_cache.lookup(
+                info.id, playback_speed)
+            if rendered_path:
+                # the speed change is already baked into the cached file
+                return self._create_audio_source(
+                    rendered_path, info.copy(local_path=rendered_path, acodec='opus'), 1.0, volume,
+                    start_at / playback_speed)
+
+        return self._create_audio_source(media_url, info, playback_speed, volume, start_at)
+
+    def _create_audio_source(self, media_url, info, playback_speed, volume, start_at=0):
+        """Builds the audio source, keeping the Python PCM path for speed-altered playback only."""
+        ffmpeg_options = self._get_ffmpeg_options(
+            playback_speed, local=info.local_path is not None, start_at=start_at)
+        if self.opus_passthrough and playback_speed == 1.0:
+            if info.acodec == 'opus' and volume == 1.0:
+                # nothing to change, so the opus packets go out untouched
+                codec = 'copy'
+            else:
+                # let ffmpeg apply the volume and encode opus itself, which
+                # skips scaling every PCM sample in python and re-encoding it.
+                # discord.py reads 'opus' and 'libopus' as copy, so leave it unset
+                codec = None
+                ffmpeg_options['options'] += f' -filter:a "volume={volume}"'
+            return discord.FFmpegOpusAudio(
+                media_url, executable=self.ffmpeg_path, codec=codec, **ffmpeg_options)
+
+        source = discord.FFmpegPCMAudio(
+            media_url, executable=self.ffmpeg_path, **ffmpeg_options)
+        return discord.PCMVolumeTransformer(source, volume=volume)
+
+    def _get_ffmpeg_options(self, playback_speed, local=False, start_at=0):
+        """Returns the appropriate FFmpeg options depending on the playback speed and source."""
+        preload_time = 1 + start_at  # seconds
+        # cached files are read from disk, so there is nothing to reconnect to
+        before_options = f'-ss {preload_time}' if local else f'-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -ss {preload_time}'
         if playback_speed != 1.0:
             return {
-                'before_options': f'-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -ss {preload_time}',
+                'before_options': before_options,
                 'options': f'-vn -filter:a "asetrate=48000*{playback_speed},aresample=48000"'
             }
         return {
-            'before_options': f'-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -ss {preload_time}',
+            'before_options': before_options,
             'options': '-vn',
         }
 
     async def _play_next_in_queue(self):
         """Plays the next song in the queue, if available."""
-        if len(self.queue) > 0:
-            url, playback_speed, requester, channel = self.queue.pop(0)
-            voice_client = discord.utils.get(
-                self.bot.voice_clients, guild=self.guild)
+        if not self.queue.is_empty():
+            entry = self.queue.pop()
+            prepared = self._take_next_source(entry)
+            voice_client = self.guild.voice_client
 
             if not voice_client:
+                if prepared:
+                    prepared['source'].cleanup()
+                self.cancel_import()
+                await self.stop_playing()
                 return
 
-            await self.play_youtube_audio(channel, voice_client, url, playback_speed, requester=requester)
+            await self.play_youtube_audio(entry.channel, voice_client, entry.url, entry.playback_speed, volume=self.volume, requester=entry.requester, prepared=prepared)
         else:
             await self.stop_playing()
 
@@ -309,18 +731,34 @@ class MusicPlayer:
             log_debug(
                 self.bot, f"Canceled disconnect timer for guild: {self.guild.name} ({self.guild.id})")
 
+    async def _disconnect_if_idle(self):
+        voice_client = self.guild.voice_client
+
+        if voice_client and not voice_client.is_playing() and not self.is_playing:
+            await voice_client.disconnect()
+            log_debug(
+                self.bot, f"Disconnected from voice channel in guild '{self.guild.name}' due to inactivity.")
+            await self.stop_playing()
+
+    def _keep_warm(self, idle_since):
+        """Returns True while the voice connection should be held open for listeners still around."""
+        voice_client = self.guild.voice_client
+        if not self.keep_warm or voice_client is None or not voice_client.is_connected():
+            return False
+        if time.monotonic() - idle_since > self.keep_warm:
+            return False
+        return any(not member.bot for member in voice_client.channel.members)
+
     async def _disconnect_after_timeout(self):
         """Waits for the inactivity duration and disconnects the bot."""
         try:
+            idle_since = time.monotonic()
             await asyncio.sleep(self.inactivity_duration)
-            voice_client = discord.utils.get(
-                self.bot.voice_clients, guild=self.guild)
-
-            if voice_client and not voice_client.is_playing():
-                await voice_client.disconnect()
-                log_debug(
-                    self.bot, f"Disconnected from voice channel in guild '{self.guild.name}' due to inactivity.")
-                await self.stop_playing()
+            # reconnecting is a multi-second handshake, so stay while the session is still going,
+            # and while a playlist is still adding songs
+            while self._keep_warm(idle_since) or self.is_importing():
+                await asyncio.sleep(self.inactivity_duration)
+            await self.call(self._disconnect_if_idle)
         except asyncio.CancelledError:
             log_debug(
                 self.bot, f"Disconnect timer was canceled for guild: {self.guild.name} ({self.guild.id})")
@@ -0,0 +1,224 @@
+import asyncio
+import time
+import discord
+from utils.logger import log_debug, log_error
+
+
+def _is_global(error):
+    """Returns True when a 429 was Discord's global rate limit rather than one channel's."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    return str(headers.get('X-RateLimit-Global', '')).lower() == 'true'
+
+
+class ProgressScheduler:
+    """
+    Refreshes the player embed of every playing guild from a single task.
+
+    Due edits are sent concurrently, but only a few at a time, so the bot
+    never bursts a pile of message edits at once and a rate limited channel
+    doesn't hold up the other guilds. An edit is skipped unless something
+    visible changed, the title, speed, up next or a progress bar segment, so
+    the elapsed time shown only moves along with the bar. Long tracks get
+    refreshed less often and paused players not at all. A guild whose channel
+    is rate limited has its own interval stretched, every guild's only on a
+    global rate limit. A guild whose refresh keeps failing is dropped without
+    holding up the others.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.base_interval = self.bot.config.get('progress_interval', 5)
+        self.max_interval = self.bot.config.get('progress_max_interval', 30)
+        self.max_failures = 3
+        self.semaphore = asyncio.Semaphore(
+            self.bot.config.get('progress_concurrency', 4))
+        self.players = {}
+        # guilds with an edit in flight, so they aren't picked again until it lands
+        self.busy = set()
+        self.refreshing = set()
+        self.backoff = 1.0
+        self.blocked_until = 0
+        self.task = None
+        self.wakeup = asyncio.Event()
+        self.edits = 0
+        self.skipped = 0
+        self.rate_limited = 0
+
+    def track(self, player):
+        """Starts refreshing a player's embed for the track it just started."""
+        # a channel that was rate limited stays backed off into the next track
+        previous = self.players.get(player.guild.id)
+        backoff = previous['backoff'] if previous else 1.0
+        self.players[player.guild.id] = {
+            'player': player,
+            'due': time.monotonic() + self.interval_for(player) * backoff,
+            'rendered': None,
+            'failures': 0,
+            'backoff': backoff,
+        }
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        self.wakeup.set()
+
+    def untrack(self, player):
+        """Stops refreshing a player's embed."""
+        state = self.players.get(player.guild.id)
+        if state and state['player'] is player:
+            del self.players[player.guild.id]
+
+    def wake(self, player):
+        """Refreshes a player's embed as soon as possible, e.g. after it resumes."""
+        state = self.players.get(player.guild.id)
+        if state and state['player'] is player:
+            state['due'] = time.monotonic()
+            self.wakeup.set()
+
+    def interval_for(self, player):
+        """Returns how long to wait between refreshes of a player's embed, before its own backoff."""
+        track = player.current_video_info
+        duration = track.duration / player.current_playback_speed if track else 0
+        # the bar has 10 segments, so long tracks change far less often per second
+        interval = min(max(self.base_interval, duration / 60), self.max_interval)
+        return interval * self.backoff
+
+    async def _run(self):
+        """Waits for the next due embeds and starts refreshing them, until no player is left."""
+        try:
+            while self.players:
+                now = time.monotonic()
+                waiting = [state['due'] for guild_id, state in self.players.items()
+                           if guild_id not in self.busy]
+                due = max(min(waiting), self.blocked_until) if waiting else None
+                if due is None or due > now:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(
+                            self.wakeup.wait(), timeout=None if due is None else due - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                for guild_id, state in list(self.players.items()):
+                    if state['due'] <= now and guild_id not in self.busy:
+                        self.busy.add(guild_id)
+                        task = asyncio.create_task(self._refresh_guild(guild_id, state))
+                        self.refreshing.add(task)
+                        task.add_done_callback(self.refreshing.discard)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log_error(self.bot, f"Error in progress scheduler: {e}")
+
+    async def _refresh_guild(self, guild_id, state):
+        try:
+            async with self.semaphore:
+                if self.players.get(guild_id) is state:
+                    await self._refresh(guild_id, state)
+                    state['failures'] = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._refresh_failed(guild_id, state, e)
+        finally:
+            self.busy.discard(guild_id)
+            self.wakeup.set()
+
+    async def _refresh(self, guild_id, state):
+        player = state['player']
+        voice_client = player.guild.voice_client
+        now = time.monotonic()
+
+        if (voice_client is None or player.player_message is None
+                or not (voice_client.is_playing() or voice_client.is_paused())):
+            self.players.pop(guild_id, None)
+            return
+
+        if voice_client.is_paused():
+            # nothing moves while paused, resuming wakes the player up again
+            state['due'] = now + self.max_interval
+            return
+
+        state['due'] = now + self.interval_for(player) * state['backoff']
+        elapsed_time = player.elapsed_time()
+        rendered = player.player_embed_key(elapsed_time)
+        if rendered == state['rendered']:
+            self.skipped += 1
+            return
+
+        embed = player.build_player_embed(elapsed_time)
+        try:
+            await player.player_message.edit(embed=embed)
+        except discord.NotFound:
+            player.player_message = None
+            self.players.pop(guild_id, None)
+            return
+        except discord.RateLimited as e:
+            self._back_off(state, e.retry_after)
+            return
+        except discord.HTTPException as e:
+            if e.status == 429 and _is_global(e):
+                self._back_off_globally(e.response.headers.get('Retry-After'))
+            elif e.status == 429:
+                self._back_off(state, None)
+            else:
+                log_error(
+                    self.bot, f"Failed to update player message in guild '{player.guild.name}': {e}")
+            return
+
+        state['rendered'] = rendered
+        self.edits += 1
+        if time.monotonic() - now > self.base_interval:
+            # discord.py sleeps through 429s itself, so a slow edit means this channel is limited
+            self._back_off(state, None)
+        else:
+            state['backoff'] = max(state['backoff'] * 0.8, 1.0)
+            self.backoff = max(self.backoff * 0.8, 1.0)
+
+    def _refresh_failed(self, guild_id, state, error):
+        player = state['player']
+        state['failures'] += 1
+        if state['failures'] >= self.max_failures:
+            # track() picks the guild up again when its next track starts
+            self.players.pop(guild_id, None)
+            log_error(
+                self.bot, f"Stopped updating the player in guild '{player.guild.name}' after {state['failures']} errors: {error}")
+        else:
+            state['due'] = time.monotonic() + self.max_interval
+            log_error(
+                self.bot, f"Error updating the player in guild '{player.guild.name}': {error}")
+
+    def _back_off(self, state, retry_after):
+        self.rate_limited += 1
+        state['backoff'] = min(state['backoff'] * 2, self.max_interval / self.base_interval)
+        if retry_after:
+            state['due'] = max(state['due'], time.monotonic() + retry_after)
+        log_debug(
+            self.bot, f"Rate limited while updating the player in guild '{state['player'].guild.name}', backing off to {state['backoff']:.1f}x")
+
+    def _back_off_globally(self, retry_after):
+        self.rate_limited += 1
+        self.backoff = min(self.backoff * 2, self.max_interval / self.base_interval)
+        if retry_after:
+            self.blocked_until = time.monotonic() + float(retry_after)
+        log_debug(
+            self.bot, f"Globally rate limited while updating player embeds, backing off to {self.backoff:.1f}x")
+
+    def stats(self):
+        """Returns the number of tracked players and edit counters."""
+        return {
+            'players': len(self.players),
+            'edits': self.edits,
+            'skipped': self.skipped,
+            'rate_limited': self.rate_limited,
+            'backoff': self.backoff,
+            'backed_off': sum(1 for state in self.players.values() if state['backoff'] > 1.0),
+        }
+
+    def shutdown(self):
+        """Stops the refresh task."""
+        self.players.clear()
+        if self.task and not self.task.done():
+            self.task.cancel()
+        for task in list(self.refreshing):
+            task.cancel()
@@ -0,0 +1,123 @@
+from collections import deque
+
+
+class QueueFullError(Exception):
+    """Raised when adding to a queue that is already at capacity."""
+
+
+class QueueEntry:
+    """A song waiting in a guild's queue."""
+
+    __slots__ = ('url', 'playback_speed', 'requester', 'channel', 'title')
+
+    def __init__(self, url, playback_speed=1.0, requester=None, channel=None, title=None):
+        self.url = url
+        self.playback_speed = playback_speed
+        self.requester = requester
+        self.channel = channel
+        # the search term or URL until the entry gets resolved
+        self.title = title or url
+
+    @property
+    def requester_id(self):
+        return self.requester.id if self.requester else None
+
+
+class PlaybackQueue:
+    """
+    Song queue backed by deques, with a size cap.
+
+    In fair mode every requester gets their own deque and songs are played
+    round-robin between requesters in the order they first queued, so one
+    user queueing a pile of songs can't push everyone else to the back.
+    """
+
+    def __init__(self, capacity=100, fair=False):
+        self.capacity = capacity
+        self.fair = fair
+        self._queue = deque()
+        self._by_requester = {}
+        self._turns = deque()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """Yields entries in the order they will be played."""
+        if not self.fair:
+            yield from self._queue
+            return
+
+        positions = dict.fromkeys(self._turns, 0)
+        turns = deque(self._turns)
+        while turns:
+            requester_id = turns.popleft()
+            entries = self._by_requester[requester_id]
+            yield entries[positions[requester_id]]
+            positions[requester_id] += 1
+            if positions[requester_id] < len(entries):
+                turns.append(requester_id)
+
+    def is_empty(self):
+        return self._size == 0
+
+    def is_full(self):
+        return self._size >= self.capacity
+
+    def push(self, entry):
+        """Adds an entry to the back of the queue, or the back of its requester's turn."""
+        if self.is_full():
+            raise QueueFullError(
+                f"Maximum queue size is {self.capacity} songs")
+
+        if self.fair:
+            requester_id = entry.requester_id
+            if requester_id not in self._by_requester:
+                self._by_requester[requester_id] = deque()
+                self._turns.append(requester_id)
+            self._by_requester[requester_id].append(entry)
+        else:
+            self._queue.append(entry)
+        self._size += 1
+
+    def pop(self):
+        """Removes and returns the next entry to play."""
+        if self._size == 0:
+            raise IndexError("pop from an empty queue")
+
+        if self.fair:
+            requester_id = self._turns.popleft()
+            entries = self._by_requester[requester_id]
+            entry = entries.popleft()
+            if entries:
+                self._turns.append(requester_id)
+            else:
+                del self._by_requester[requester_id]
+        else:
+            entry = self._queue.popleft()
+        self._size -= 1
+        return entry
+
+    def head(self):
+        """Returns the next entry to play without removing it, or None."""
+        if self._size == 0:
+            return None
+        if self.fair:
+            return self._by_requester[self._turns[0]][0]
+        return self._queue[0]
+
+    def peek(self, count):
+        """Returns up to `count` upcoming entries in play order."""
+        upcoming = []
+        for entry in self:
+            if len(upcoming) >= count:
+                break
+            upcoming.append(entry)
+        return upcoming
+
+    def clear(self):
+        self._queue.clear()
+        self._by_requester.clear()
+        self._turns.clear()
+        self._size = 0
@@ -0,0 +1,209 @@
+import asyncio
+import re
+import yt_dlp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from utils.logger import log_debug
+from cogs.Music.music_cache import MusicCache, normalize_query
+from cogs.Music.music_disk_cache import MusicDiskCache
+
+
+YDL_OPTIONS = {
+    # opus streams can be handed to discord without re-encoding
+    'format': 'bestaudio[acodec=opus]/bestaudio/best',
+    'noplaylist': True,
+    'quiet': True,
+    'postprocessors': [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'opus',
+        'preferredquality': '198',
+    }],
+    'writethumbnail': True,
+    'outtmpl': 'thumbnails/%(id)s.%(ext)s',
+}
+# flat extraction only lists a playlist's entries, without resolving any streams
+PLAYLIST_OPTIONS = {
+    'extract_flat': 'in_playlist',
+    'skip_download': True,
+    'quiet': True,
+}
+UNAVAILABLE_TITLES = {'[Private video]', '[Deleted video]'}
+URL_REGEX = re.compile(r'^(https?://)?(www\.)?(youtube\.com|youtu\.?be)/.+$')
+
+
+def _extract_info(search_query, ydl_opts, sanitize=False):
+    """Runs yt-dlp extraction inside a pool worker."""
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(search_query, download=False)
+        # process workers have to hand back something picklable
+        return ydl.sanitize_info(info) if sanitize else info
+
+
+class ExtractorBusyError(Exception):
+    """Raised when the extractor pool already has too many lookups waiting."""
+
+
+class MusicResolver:
+    """Runs yt-dlp lookups in a bounded worker pool shared by every guild."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.workers = self.bot.config.get('extractor_workers', 4)
+        self.timeout = self.bot.config.get('extractor_timeout', 30)
+        self.max_pending = self.bot.config.get('extractor_max_pending', 16)
+        # speculative lookups only get half the queue, so /play always has room
+        self.max_background = self.max_pending // 2
+        self.use_processes = self.bot.config.get(
+            'extractor_mode', 'thread') == 'process'
+        if self.use_processes:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='yobot-extractor')
+        self.pending = 0
+        self.cache = MusicCache(
+            max_entries=self.bot.config.get('track_cache_size', 512),
+            metadata_ttl=self.bot.config.get('track_metadata_ttl', 86400),
+            stream_ttl=self.bot.config.get('track_stream_ttl', 3600),
+        )
+        self.disk_cache = MusicDiskCache(bot)
+        self.inflight = {}
+        self.coalesced = 0
+        self.playlist_chunk_size = self.bot.config.get('playlist_chunk_size', 25)
+
+    async def extract(self, search_query, ydl_opts=None, background=False):
+        """Runs a raw extraction in the pool with a timeout and depth limit."""
+        if self.pending >= (self.max_background if background else self.max_pending):
+            raise ExtractorBusyError(
+                f"{self.pending} lookups already waiting for the extractor")
+
+        loop = asyncio.get_running_loop()
+        work = self.executor.submit(
+            _extract_info, search_query, ydl_opts or YDL_OPTIONS, self.use_processes)
+
+        # count the worker as busy until it actually finishes, even when the
+        # caller gave up on it after a timeout or cancellation
+        self.pending += 1
+        work.add_done_callback(lambda _: self._release(loop))
+
+        return await asyncio.wait_for(asyncio.wrap_future(work), timeout=self.timeout)
+
+    async def resolve(self, media_query, min_stream_ttl=0, background=False):
+        """
+        Resolves a URL or search term to a TrackInfo, using the cache when possible.
+
+        A cached stream URL is only reused if it stays valid for another
+        `min_stream_ttl` seconds, which lets prefetching re-validate URLs that
+        would expire before their track gets to play. A `background` lookup
+        gives up with ExtractorBusyError once half the extractor queue is
+        taken, leaving the rest for lookups somebody is waiting on.
+        """
+        query_key = normalize_query(media_query)
+        track = self.cache.get(query_key, min_stream_ttl)
+        if track and self.disk_cache.lookup(track.id):
+            # a local copy needs no stream URL at all
+            return self._with_local_copy(track)
+        if track is None:
+            # a track kept on disk needs no lookup, even once it has left the metadata cache
+            track = self.disk_cache.find(query_key)
+            if track:
+                log_debug(self.bot, f"Audio cache hit for {query_key}")
+                return track
+        if track and track.url:
+            log_debug(self.bot, f"Track cache hit for {query_key}")
+            return track
+
+        # callers asking for the same thing at the same time share one lookup
+        flight = self.inflight.get(query_key)
+        if flight is None:
+            task = asyncio.ensure_future(
+                self._resolve_uncached(query_key, media_query, track, background))
+            flight = self.inflight[query_key] = {
+                'task': task, 'waiters': 0, 'background': background}
+            task.add_done_callback(
+                lambda _: self._land(query_key, flight))
+        else:
+            self.coalesced += 1
+            log_debug(self.bot, f"Joined in-flight lookup for {query_key}")
+
+        flight['waiters'] += 1
+        try:
+            return self._with_local_copy((await asyncio.shield(flight['task'])).copy())
+        except ExtractorBusyError:
+            if background or not flight['background']:
+                raise
+            # joined a background lookup that was turned away, this one gets the full limit
+            return await self.resolve(media_query, min_stream_ttl)
+        except asyncio.CancelledError:
+            # only give up on the shared lookup once nobody is waiting on it
+            if flight['waiters'] == 1:
+                flight['task'].cancel()
+            raise
+        finally:
+            flight['waiters'] -= 1
+
+    async def _resolve_uncached(self, query_key, media_query, track, background=False):
+        """Extracts a track that was missing from the cache or had a stale stream URL."""
+        if track:
+            # metadata is still good, only the stream URL went stale, so skip the search
+            search_query = track.webpage_url
+        elif URL_REGEX.match(media_query):
+            search_query = media_query
+        else:
+            search_query = f'ytsearch1:{media_query}'
+
+        info = await self.extract(search_query, background=background)
+        if 'entries' in info:
+            entries = [entry for entry in info['entries'] if entry]
+            if not entries:
+                raise ValueError(f"No results found for {media_query}")
+            info = entries[0]
+        track = self.cache.put(query_key, info)
+        self.disk_cache.remember_query(query_key, track.id)
+        return track
+
+    async def iter_playlist(self, playlist_url, max_entries=100):
+        """
+        Yields the flat entries of a playlist, fetching them a chunk at a time.
+
+        Each chunk is its own extraction in the worker pool, so the first songs
+        can be queued while the rest of a long playlist is still being listed.
+        Private and deleted videos are left out.
+        """
+        start = 1
+        while start <= max_entries:
+            end = min(start + self.playlist_chunk_size - 1, max_entries)
+            info = await self.extract(
+                playlist_url, dict(PLAYLIST_OPTIONS, playlist_items=f'{start}-{end}'))
+            # count before dropping missing entries, they still take up a slot in the chunk
+            entries = info.get('entries') or []
+            for entry in entries:
+                if entry and entry.get('title') not in UNAVAILABLE_TITLES:
+                    yield entry
+            if len(entries) <= end - start:
+                # a short chunk means the playlist ran out
+                return
+            start = end + 1
+
+    def _with_local_copy(self, track):
+        local_path = self.disk_cache.lookup(track.id)
+        if local_path:
+            track.local_path = local_path
+            track.acodec = 'opus'
+        return track
+
+    def _land(self, query_key, flight):
+        if self.inflight.get(query_key) is flight:
+            del self.inflight[query_key]
+
+    def _release(self, loop):
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._decrement_pending)
+
+    def _decrement_pending(self):
+        self.pending -= 1
+
+    def shutdown(self):
+        """Stops the worker pool, dropping lookups that have not started."""
+        log_debug(self.bot, "Shutting down music extractor pool.")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.disk_cache.shutdown()
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import time
+from utils.logger import log_debug, log_error
+from utils.tools import connect_voice
+from cogs.Music.music_cache import normalize_query
+
+
+class MusicSnapshot:
+    """
+    Saves every guild's queue and current track so a restart can pick them up.
+
+    The snapshot is written every `music_snapshot_interval` seconds, only when
+    something changed, and once more on shutdown. On startup the queues are
+    handed back to players as they get created, guilds that were playing
+    rejoin their voice channel and carry on near where they stopped, and the
+    resolver cache is seeded with the saved tracks so none of them have to go
+    through yt-dlp again.
+    """
+
+    def __init__(self, bot, manager):
+        self.bot = bot
+        self.manager = manager
+        self.state_file = self.bot.data_dir / 'music_state.json'
+        self.interval = self.bot.config.get('music_snapshot_interval', 30)
+        self.max_age = self.bot.config.get('music_snapshot_max_age', 900)
+        # guild id -> saved state, until that guild's player is created
+        self.pending = {}
+        self.loaded_at = 0
+        self.task = None
+        self.last_written = None
+        self.last_write_at = 0
+        self.saves = 0
+        self.resumed = 0
+
+    def load(self):
+        """Reads the last snapshot, ignoring it when it is older than the max age."""
+        try:
+            with open(self.state_file, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            log_error(self.bot, f"Error reading music snapshot: {e}")
+            return 0
+
+        age = time.time() - data.get('saved_at', 0)
+        if age > self.max_age:
+            log_debug(
+                self.bot, f"Ignoring music snapshot from {age:.0f} seconds ago")
+            return 0
+
+        self.manager.resolver.cache.load(data.get('cache', []))
+        self.pending = {state['guild_id']: state for state in data.get('players', [])}
+        self.loaded_at = time.time()
+        log_debug(
+            self.bot, f"Loaded music snapshot with {len(self.pending)} players")
+        return len(self.pending)
+
+    def restore_player(self, player):
+        """Hands a newly created player the queue saved for its guild."""
+        state = self.pending.pop(player.guild.id, None)
+        if state:
+            restored = player.restore_queue(state)
+            log_debug(
+                self.bot, f"Restored {restored} queued songs for guild: {player.guild.name} ({player.guild.id})")
+
+    def start(self):
+        """Starts resuming saved playback and the periodic save."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        try:
+            await self.resume_all()
+        except Exception as e:
+            log_error(self.bot, f"Error resuming music playback: {e}")
+
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception as e:
+                log_error(self.bot, f"Error saving music snapshot: {e}")
+
+    async def resume_all(self):
+        """Rejoins the voice channels that were playing and resumes their tracks."""
+        for guild_id, state in list(self.pending.items()):
+            if not state.get('playing') or not state.get('voice_channel_id'):
+                continue
+            guild = self.bot.get_guild(guild_id)
+            channel = guild.get_channel(state['voice_channel_id']) if guild else None
+            # nobody is left to listen, the queue still comes back on the next request
+            if channel is None or not any(not member.bot for member in channel.members):
+                continue
+
+            try:
+                voice_client = await connect_voice(self.bot, channel)
+                player = await self.manager.get_player(guild)
+                if await player.call(player.resume_snapshot, voice_client, state):
+                    self.resumed += 1
+            except Exception as e:
+                log_error(
+                    self.bot, f"Error resuming playback in guild '{guild.name}': {e}")
+
+    def capture(self):
+        """Returns the state of every player, plus the saved ones not picked up yet."""
+        players = [state for state in (player.snapshot() for player in list(self.manager.players.values()))
+                   if state]
+        live = {state['guild_id'] for state in players}
+        players.extend(state for guild_id, state in self.pending.items()
+                       if guild_id not in live)
+        # only the tracks the snapshot refers to, the rest of the cache isn't worth the file size
+        query_keys = set()
+        for state in players:
+            items = state['queue'] + ([state['playing']] if state['playing'] else [])
+            query_keys.update(normalize_query(item['url']) for item in items)
+        return {'players': players, 'cache': self.manager.resolver.cache.export(query_keys)}
+
+    def _dump(self, force=False):
+        now = time.time()
+        if self.pending and now - self.loaded_at > self.max_age:
+            # saved queues nobody came back for would otherwise be carried over forever
+            self.pending.clear()
+
+        # track positions move on while playing, so it is mostly idle bots that skip writes
+        state = self.capture()
+        # rewrite now and then anyway, so the file never looks older than the max age
+        stale = now - self.last_write_at > self.max_age / 3
+        if state == self.last_written and not stale and not force:
+            return None
+        self.last_written = state
+        self.last_write_at = now
+        return {'saved_at': now, **state}
+
+    def _write(self, data):
+        # nothing capture() returns is changed later, so it can be serialized off the event loop
+        temp_file = self.state_file.with_suffix('.tmp')
+        with open(temp_file, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temp_file, self.state_file)
+
+    async def save(self):
+        """Writes the snapshot in the background if anything changed since the last one."""
+        data = self._dump()
+        if data is None:
+            return False
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+        self.saves += 1
+        return True
+
+    def stats(self):
+        return {
+            'pending': len(self.pending),
+            'saves': self.saves,
+            'resumed': self.resumed,
+        }
+
+    def shutdown(self):
+        """Stops the periodic save and writes a final snapshot."""
+        if self.task and not self.task.done():
+            self.task.cancel()
+        try:
+            self._write(self._dump(force=True))
+        except OSError as e:
+            log_error(self.bot, f"Error saving music snapshot: {e}")
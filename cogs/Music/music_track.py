@@ -0,0 +1,53 @@
+class TrackInfo:
+    """
+    The handful of fields the player needs from a yt-dlp info dict.
+
+    The raw info dict carries every format, thumbnail and HTTP header for a
+    video, so only these are kept around while a track is cached or playing.
+    """
+
+    __slots__ = ('id', 'title', 'webpage_url', 'duration', 'thumbnail',
+                 'genre', 'acodec', 'url', 'local_path')
+
+    def __init__(self, id=None, title=None, webpage_url=None, duration=None, thumbnail=None,
+                 genre='Unknown', acodec=None, url=None, local_path=None):
+        self.id = id
+        self.title = title
+        self.webpage_url = webpage_url
+        self.duration = duration
+        self.thumbnail = thumbnail
+        self.genre = genre
+        self.acodec = acodec
+        self.url = url
+        self.local_path = local_path
+
+    @classmethod
+    def from_info(cls, info):
+        """Builds a track from a yt-dlp info dict."""
+        genre = info.get('genre') or info.get('genres') or info.get('categories')
+        if isinstance(genre, (list, tuple)):
+            genre = genre[0] if genre else None
+        return cls(
+            id=info.get('id'),
+            title=info.get('title'),
+            webpage_url=info.get('webpage_url'),
+            duration=info.get('duration') or 0,
+            thumbnail=info.get('thumbnail'),
+            genre=genre or 'Unknown',
+            acodec=info.get('acodec'),
+            url=info.get('url'),
+        )
+
+    def to_dict(self):
+        """Returns the track's fields as a dict, leaving out the local file path."""
+        return {field: getattr(self, field) for field in self.__slots__ if field != 'local_path'}
+
+    def copy(self, **changes):
+        """Returns a copy of the track with some fields replaced."""
+        track = TrackInfo.__new__(TrackInfo)
+        for field in self.__slots__:
+            setattr(track, field, changes.get(field, getattr(self, field)))
+        return track
+
+    def __repr__(self):
+        return f"<TrackInfo id={self.id!r} title={self.title!r}>"
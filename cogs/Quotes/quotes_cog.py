@@ -10,59 +10,21 @@ class QuotesCog(commands.Cog, name="QuotesCog", description="A cog for managing
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self._initialize_quotes_db()
-
-    def _initialize_quotes_db(self):
-        """Initialize the SQLite database and create the required tables."""
-        try:
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                # Enable foreign key support
-                cursor.execute('PRAGMA foreign_keys = ON;')
-
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS quotes (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        guild_id INTEGER NOT NULL,
-                        user_id INTEGER NOT NULL,
-                        user_name TEXT NOT NULL,
-                        quote_title TEXT NOT NULL,
-                        quote TEXT NOT NULL,
-                        author TEXT NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                cursor.execute(
-                    'CREATE INDEX IF NOT EXISTS idx_quotes_guild_id ON quotes (guild_id)'
-                )
-
-                conn.commit()
-        except sqlite3.Error as e:
-            log_error(self.bot, f"Error initializing quotes database: {str(e)}")
-        except Exception as e:
-            log_error(self.bot, f"Error initializing quotes database: {str(e)}")
 
     @commands.hybrid_command(name="quote", help="Get a random quote from the database.")
     async def quote(self, ctx: commands.Context):
         """Get a random quote from the database."""
         try:
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                cursor.execute(
-                    'SELECT * FROM quotes WHERE guild_id = ? ORDER BY RANDOM() LIMIT 1',
-                    (ctx.guild.id,)
-                )
-
-                quote = cursor.fetchone()
+            quote = await self.bot.db.fetchone(
+                'SELECT * FROM quotes WHERE guild_id = ? ORDER BY RANDOM() LIMIT 1',
+                (ctx.guild.id,)
+            )
 
-                if not quote:
-                    await ctx.send("No quotes found.")
-                    return
+            if not quote:
+                await ctx.send("No quotes found.")
+                return
 
-                await ctx.send(f"{quote[5]} -{quote[6]}")  # quote, -author
+            await ctx.send(f"{quote[5]} -{quote[6]}")  # quote, -author
         except sqlite3.Error as e:
             await ctx.send("An error occurred while fetching a quote. Please try again later.")
             log_error(self.bot, f"Error getting quote: {e}")
@@ -79,35 +41,30 @@ class QuotesCog(commands.Cog, name="QuotesCog", description="A cog for managing
                 await ctx.send("Please provide exactly one of quote id, title, or author.", delete_after=12)
                 return
 
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                if quote_id:
-                    cursor.execute(
-                        'SELECT * FROM quotes WHERE id = ? AND guild_id = ?',
-                        (quote_id, ctx.guild.id)
-                    )
-                elif quote_title:
-                    cursor.execute(
-                        'SELECT * FROM quotes WHERE quote_title = ? AND guild_id = ?',
-                        (quote_title, ctx.guild.id)
-                    )
-                elif author:
-                    cursor.execute(
-                        'SELECT * FROM quotes WHERE author = ? AND guild_id = ?',
-                        (author, ctx.guild.id)
-                    )
-                else:
-                    await ctx.send("Please provide a quote id or title or author.")
-                    return
-
-                quote = cursor.fetchone()
+            if quote_id:
+                quote = await self.bot.db.fetchone(
+                    'SELECT * FROM quotes WHERE id = ? AND guild_id = ?',
+                    (quote_id, ctx.guild.id)
+                )
+            elif quote_title:
+                quote = await self.bot.db.fetchone(
+                    'SELECT * FROM quotes WHERE quote_title = ? AND guild_id = ?',
+                    (quote_title, ctx.guild.id)
+                )
+            elif author:
+                quote = await self.bot.db.fetchone(
+                    'SELECT * FROM quotes WHERE author = ? AND guild_id = ?',
+                    (author, ctx.guild.id)
+                )
+            else:
+                await ctx.send("Please provide a quote id or title or author.")
+                return
 
-                if not quote:
-                    await ctx.send("No quote found.")
-                    return
+            if not quote:
+                await ctx.send("No quote found.")
+                return
 
-                await ctx.send(f"{quote[5]} -{quote[6]}")  # quote, -author
+            await ctx.send(f"{quote[5]} -{quote[6]}")  # quote, -author
         except sqlite3.Error as e:
             await ctx.send("An error occurred while fetching a quote. Please try again later.")
             log_error(self.bot, f"Error getting quote: {e}")
@@ -139,25 +96,20 @@ class QuotesCog(commands.Cog, name="QuotesCog", description="A cog for managing
                     await ctx.send(f"{field_name.capitalize()} contains invalid characters. Please remove them.", delete_after=12)
                     return
 
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                cursor.execute(
-                    'INSERT INTO quotes (guild_id, user_id, user_name, quote_title, quote, author) VALUES (?, ?, ?, ?, ?, ?)',
-                    (
-                        ctx.guild.id,
-                        ctx.author.id,
-                        ctx.author.display_name,
-                        quote_title,
-                        quote,
-                        author
-                    )
+            cursor = await self.bot.db.execute(
+                'INSERT INTO quotes (guild_id, user_id, user_name, quote_title, quote, author) VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    ctx.guild.id,
+                    ctx.author.id,
+                    ctx.author.display_name,
+                    quote_title,
+                    quote,
+                    author
                 )
+            )
 
-                conn.commit()
-
-                await ctx.send(f"Quote added for {author} by {ctx.author.mention} with title: {quote_title}\n**Quote ID:** {cursor.lastrowid}")
-                log_info(self.bot, f"Quote added by {ctx.author}.")
+            await ctx.send(f"Quote added for {author} by {ctx.author.mention} with title: {quote_title}\n**Quote ID:** {cursor.lastrowid}")
+            log_info(self.bot, f"Quote added by {ctx.author}.")
         except sqlite3.Error as e:
             await ctx.send("An error occurred while adding a quote. Please try again later.")
             log_error(self.bot, f"Error adding quote: {e}")
@@ -175,31 +127,26 @@ class QuotesCog(commands.Cog, name="QuotesCog", description="A cog for managing
                 await ctx.send("Please provide exactly one of quote id or title.", delete_after=12)
                 return
             
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                if quote_id:
-                    cursor.execute(
-                        'DELETE FROM quotes WHERE id = ? AND guild_id = ?',
-                        (quote_id, ctx.guild.id)
-                    )
-                elif quote_title:
-                    cursor.execute(
-                        'DELETE FROM quotes WHERE quote_title = ? AND guild_id = ?',
-                        (quote_title, ctx.guild.id)
-                    )
-                else:
-                    await ctx.send("Please provide a quote id or title.")
-                    return
+            if quote_id:
+                cursor = await self.bot.db.execute(
+                    'DELETE FROM quotes WHERE id = ? AND guild_id = ?',
+                    (quote_id, ctx.guild.id)
+                )
+            elif quote_title:
+                cursor = await self.bot.db.execute(
+                    'DELETE FROM quotes WHERE quote_title = ? AND guild_id = ?',
+                    (quote_title, ctx.guild.id)
+                )
+            else:
+                await ctx.send("Please provide a quote id or title.")
+                return
 
-                conn.commit()
-                
-                if cursor.rowcount == 0:
-                    await ctx.send("No quote found to delete.")
-                    return
+            if cursor.rowcount == 0:
+                await ctx.send("No quote found to delete.")
+                return
 
-                await ctx.send(f"**Quote deleted.**\n\nRemoved: `{quote_id if quote_id else quote_title}`")
-                log_info(self.bot, f"Quote deleted by {ctx.author}.")
+            await ctx.send(f"**Quote deleted.**\n\nRemoved: `{quote_id if quote_id else quote_title}`")
+            log_info(self.bot, f"Quote deleted by {ctx.author}.")
         except sqlite3.Error as e:
             await ctx.send("An error occurred while deleting a quote. Please try again later.")
             log_error(self.bot, f"Error deleting quote: {e}")
@@ -211,42 +158,37 @@ class QuotesCog(commands.Cog, name="QuotesCog", description="A cog for managing
     async def list_quotes(self, ctx: commands.Context):
         """List all quotes in a list by id and title in an embed, if there are more than 10 lines, use buttons to change pages."""
         try:
-            with sqlite3.connect(self.bot.data_dir / 'server_stats.db') as conn:
-                cursor = conn.cursor()
-
-                cursor.execute(
-                    'SELECT id, quote_title FROM quotes WHERE guild_id = ?',
-                    (ctx.guild.id,)
-                )
-
-                quotes = cursor.fetchall()
+            quotes = await self.bot.db.fetchall(
+                'SELECT id, quote_title FROM quotes WHERE guild_id = ?',
+                (ctx.guild.id,)
+            )
 
-                if not quotes:
-                    await ctx.send("No quotes found.")
-                    return
-
-                # to make discord happy, 10 per page
-                quotes_per_page = 10
-                total_pages = math.ceil(len(quotes) / quotes_per_page)
-                pages = []
+            if not quotes:
+                await ctx.send("No quotes found.")
+                return
 
-                for i in range(total_pages):
-                    start = i * quotes_per_page
-                    end = start + quotes_per_page
-                    page_quotes = quotes[start:end]
-                    quotes_list = "\n".join([f"**{quote[0]}** - {quote[1]}" for quote in page_quotes])
-                    pages.append(quotes_list)
+            # to make discord happy, 10 per page
+            quotes_per_page = 10
+            total_pages = math.ceil(len(quotes) / quotes_per_page)
+            pages = []
+
+            for i in range(total_pages):
+                start = i * quotes_per_page
+                end = start + quotes_per_page
+                page_quotes = quotes[start:end]
+                quotes_list = "\n".join([f"**{quote[0]}** - {quote[1]}" for quote in page_quotes])
+                pages.append(quotes_list)
                     
-                if total_pages == 1:
-                    embed = discord.Embed(
-                        title="Quotes",
-                        description=pages[0],
-                        color=discord.Color.blue()
-                    )
-                    await ctx.send(embed=embed)
-                else:    
-                    paginator = Paginator(ctx, pages, title="Quotes")
-                    await paginator.start()
+            if total_pages == 1:
+                embed = discord.Embed(
+                    title="Quotes",
+                    description=pages[0],
+                    color=discord.Color.blue()
+                )
+                await ctx.send(embed=embed)
+            else:    
+                paginator = Paginator(ctx, pages, title="Quotes")
+                await paginator.start()
         except sqlite3.Error as e:
             await ctx.send("An error occurred while listing quotes. Please try again later.")
             log_error(self.bot, f"Error listing quotes: {e}")
@@ -4,6 +4,8 @@ import os
 from discord.ext import commands
 from dotenv import load_dotenv
 from discord_bot.terminal import terminal_command_loop
+from utils.database import Database
+from utils.migrations import migrate
 
 load_dotenv()
 
@@ -27,6 +29,7 @@ class Bot(commands.Bot):
         Side Effects:
           Sets the bot's logger, paths, config file, avatar file, cogs directory, guild ID, owner ID, chatbot category ID, chatbot threads ID, Discord token, OpenAI API key, OpenAI model, Pinecone API key, Pinecone environment, and Pinecone index.
           Loads the config file.
+          Opens the shared database.
           Sets the bot's display name.
         Examples:
           >>> bot = Bot(intents, paths, logger)
@@ -48,6 +51,7 @@ class Bot(commands.Bot):
             self.config = json.load(f)
 
         self.display_name = self.config.get("bot_name")
+        self.db = Database(self.data_dir / "server_stats.db", self.config, self.log)
 
         super().__init__(command_prefix=self.config.get("prefix"), intents=intents)
         self.log.debug("Bot initialized.")
@@ -56,6 +60,7 @@ class Bot(commands.Bot):
     async def start_bot(self):
         """Starts bot."""
         self.log.info("Bot starting...")
+        await migrate(self.db)
         await self.load_cogs()
 
         bot_task = asyncio.create_task(
@@ -69,7 +74,20 @@ class Bot(commands.Bot):
             self.log.error(f"Bot encountered an error: {str(e)}")
 
         finally:
+            try:
+                # unloads the cogs, so they can save their state before the loop stops
+                await self.close()
+            except Exception as e:
+                self.log.error(f"Error closing bot: {str(e)}")
             bot_task.cancel()
+            # nothing may still be using the database when it closes
+            try:
+                await bot_task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                self.log.error(f"Bot encountered an error: {str(e)}")
+            self.db.close()
 
     async def start_terminal_command_loop(self):
         """Starts the terminal command loop."""
@@ -3,7 +3,7 @@ from discord.ext import commands
 from utils.terminal_cmds import (exit_bot_terminal, ping, set_bot_avatar,
                                  set_bot_name, set_bot_presence,
                                  set_owner, show_aliases,
-                                 show_help, sync_commands,
+                                 show_help, show_music_stats, sync_commands,
                                  toggle_debug_mode, wipe_config)
 
 
@@ -118,5 +118,9 @@ class TerminalCommands:
             self.bot.log.debug("Toggling debug mode...")
             toggle_debug_mode(self.bot)
 
+        elif user_command in ["musicstats", "ms"]:
+            self.bot.log.debug("Showing music stats...")
+            show_music_stats(self.bot)
+
         else:
             self.bot.log.info(f"{user_command} is not a recognized command.")
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+
+def _write_rows(conn: sqlite3.Connection, query: str, rows: list) -> None:
+    with conn:
+        conn.executemany(query, rows)
+
+
+class Database:
+    """
+    Shared access to the bot's SQLite database.
+    One connection lives on a dedicated thread and every query runs there,
+    so database work never blocks the event loop and no command pays for
+    opening a connection. Pragmas are applied once when the connection
+    opens, and sqlite3 keeps the prepared statements for repeated queries.
+    Args:
+      path (Path): The path to the database file.
+      config (dict): The bot's configuration.
+      log (Logger): Where failed background writes are reported.
+    Examples:
+      >>> db = Database(bot.data_dir / 'server_stats.db', bot.config)
+      >>> rows = await db.fetchall('SELECT * FROM quotes WHERE guild_id = ?', (guild_id,))
+    """
+
+    def __init__(self, path: Path, config: dict = None, log: logging.Logger = None):
+        config = config or {}
+        self.path = path
+        self.config = config
+        self.log = log or logging.getLogger(__name__)
+        self.cache_kb = config.get("db_cache_kb", 16384)
+        self.mmap_size = config.get("db_mmap_size", 268435456)
+        self.statement_cache = config.get("db_statement_cache", 256)
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="database")
+        self.conn = None
+        self.closed = False
+        self.writers = []
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, cached_statements=self.statement_cache)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        # WAL keeps the database consistent with NORMAL, a crash can only lose the last commits
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_kb)};")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)};")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        conn.execute("PRAGMA foreign_keys = ON;")
+        return conn
+
+    def _call(self, function: Callable, *args) -> Any:
+        if self.conn is None:
+            self.conn = self._connect()
+        return function(self.conn, *args)
+
+    async def run(self, function: Callable, *args) -> Any:
+        """
+        Runs a function with the connection on the database thread.
+        Use this for work that needs several statements in one transaction.
+        Args:
+          function (Callable): Called as function(conn, *args).
+        Returns:
+          Any: Whatever the function returns.
+        Examples:
+          >>> await db.run(lambda conn: conn.execute('SELECT 1').fetchone())
+          (1,)
+        """
+        if self.closed:
+            raise sqlite3.ProgrammingError("Cannot use a closed database.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call, function, *args)
+
+    async def execute(self, query: str, params: Iterable = ()) -> sqlite3.Cursor:
+        """
+        Runs a write and commits it.
+        Args:
+          query (str): The SQL statement.
+          params (Iterable): The statement's parameters.
+        Returns:
+          Cursor: The spent cursor, for its lastrowid and rowcount.
+        Examples:
+          >>> cursor = await db.execute('DELETE FROM quotes WHERE id = ?', (1,))
+          >>> cursor.rowcount
+          1
+        """
+        def write(conn):
+            with conn:
+                return conn.execute(query, params)
+        return await self.run(write)
+
+    async def fetchone(self, query: str, params: Iterable = ()) -> tuple:
+        """
+        Runs a query and returns its first row.
+        Args:
+          query (str): The SQL query.
+          params (Iterable): The query's parameters.
+        Returns:
+          tuple: The first row, or None when there is none.
+        Examples:
+          >>> await db.fetchone('SELECT COUNT(*) FROM quotes')
+          (12,)
+        """
+        return await self.run(lambda conn: conn.execute(query, params).fetchone())
+
+    async def fetchall(self, query: str, params: Iterable = ()) -> list:
+        """
+        Runs a query and returns every row.
+        Args:
+          query (str): The SQL query.
+          params (Iterable): The query's parameters.
+        Returns:
+          list: The rows.
+        Examples:
+          >>> await db.fetchall('SELECT id, quote_title FROM quotes WHERE guild_id = ?', (guild_id,))
+          [(1, 'title')]
+        """
+        return await self.run(lambda conn: conn.execute(query, params).fetchall())
+
+    def batch_writer(self, query: str) -> "BatchWriter":
+        """
+        Creates a writer that buffers rows for an INSERT and writes them in batches.
+        Whatever is still buffered gets written when the database closes.
+        Args:
+          query (str): The SQL statement to run for every row.
+        Returns:
+          BatchWriter: The writer.
+        Examples:
+          >>> writer = db.batch_writer('INSERT INTO command_usage (guild_id, command_name) VALUES (?, ?)')
+          >>> await writer.add((guild_id, 'play'))
+        """
+        writer = BatchWriter(self, query,
+                             batch_size=self.config.get("db_batch_size", 200),
+                             interval=self.config.get("db_batch_interval", 5),
+                             capacity=self.config.get("db_batch_capacity", 5000))
+        self.writers.append(writer)
+        return writer
+
+    def close(self) -> None:
+        """
+        Writes out buffered rows and waits for queued queries to finish, then closes the connection.
+        Returns:
+          None
+        Examples:
+          >>> db.close()
+        """
+        def close_connection():
+            if self.conn is not None:
+                self.conn.execute("PRAGMA optimize;")
+                self.conn.close()
+                self.conn = None
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            for writer in self.writers:
+                writer.cancel()
+                rows = writer.take()
+                if rows:
+                    try:
+                        self.executor.submit(self._call, _write_rows, writer.query, rows).result()
+                    except sqlite3.Error as e:
+                        self.log.error(f"Lost {len(rows)} buffered rows on shutdown: {e}")
+            self.executor.submit(close_connection).result()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+class BatchWriter:
+    """
+    Buffers rows for one INSERT and writes them in a single transaction.
+    A batch goes out once `batch_size` rows are waiting or `interval`
+    seconds after the first one, so a burst of events costs one commit
+    instead of one each. When `capacity` rows are waiting, adding more
+    waits for a flush, so a slow disk holds callers back instead of the
+    buffer growing without bound.
+    Args:
+      db (Database): The database to write to.
+      query (str): The SQL statement to run for every row.
+      batch_size (int): How many rows trigger a flush.
+      interval (float): The most seconds a row waits before it is written.
+      capacity (int): How many rows can wait before adding blocks.
+    """
+
+    def __init__(self, db: Database, query: str, batch_size: int = 200, interval: float = 5, capacity: int = 5000):
+        self.db = db
+        self.query = query
+        self.batch_size = batch_size
+        self.interval = interval
+        self.capacity = capacity
+        self.rows = []
+        self.lock = asyncio.Lock()
+        self.ready = asyncio.Event()
+        self.task = None
+        self.written = 0
+        self.flushes = 0
+        self.stalls = 0
+
+    async def add(self, row: tuple) -> None:
+        """
+        Buffers a row, waiting for a flush first if the buffer is full.
+        Args:
+          row (tuple): The statement's parameters.
+        Returns:
+          None
+        Examples:
+          >>> await writer.add((guild_id, 'play'))
+        """
+        if len(self.rows) >= self.capacity:
+            self.stalls += 1
+            await self.flush()
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.ready.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self.rows:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.ready.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Writes every buffered row now.
+        Returns:
+          int: How many rows were written.
+        Examples:
+          >>> await writer.flush()
+          42
+        """
+        async with self.lock:
+            rows = self.take()
+            if not rows:
+                return 0
+            try:
+                await self.db.run(_write_rows, self.query, rows)
+            except sqlite3.Error as e:
+                self.db.log.error(f"Error writing {len(rows)} buffered rows: {e}")
+                # keep them for the next flush, as long as that doesn't overflow the buffer
+                if len(rows) + len(self.rows) <= self.capacity:
+                    self.rows[:0] = rows
+                return 0
+            self.written += len(rows)
+            self.flushes += 1
+            return len(rows)
+
+    def take(self) -> list:
+        """Empties the buffer, returning the rows that were in it."""
+        rows, self.rows = self.rows, []
+        return rows
+
+    def cancel(self) -> None:
+        """Stops the background flush."""
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    def stats(self) -> dict:
+        """Returns the buffer size and write counters."""
+        return {
+            "buffered": len(self.rows),
+            "written": self.written,
+            "flushes": self.flushes,
+            "stalls": self.stalls,
+        }
@@ -0,0 +1,291 @@
+import logging
+import sqlite3
+import time
+from typing import Any, Callable
+from utils.database import Database
+
+
+def _in_transaction(conn: sqlite3.Connection, function: Callable) -> Any:
+    # sqlite3 only opens transactions for DML on its own, schema changes need an explicit one
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        result = function(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return result
+
+
+def _add_column(table: str, column: str, definition: str) -> Callable:
+    def add(conn):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table});")]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    return add
+
+
+class Migration:
+    """
+    A schema change that is applied once, in one transaction with the version bump.
+    If any step fails nothing is kept, and it is tried again on the next start.
+    Args:
+      version (int): The user_version the database is at once this is applied.
+      description (str): What the migration does, for the log.
+      steps (list): SQL statements, or functions called with the connection.
+    """
+
+    def __init__(self, version: int, description: str, steps: list):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+    def apply(self, conn: sqlite3.Connection, chunk_size: int, log: logging.Logger) -> None:
+        def run(conn):
+            for step in self.steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {int(self.version)};")
+        _in_transaction(conn, run)
+
+
+class Backfill(Migration):
+    """
+    Runs a statement over a table's rows in id ranges, committing after each one.
+    Short transactions keep the WAL small and the write lock free between chunks
+    on large tables. The last id done is saved with every chunk, so a backfill
+    that gets interrupted carries on from there instead of starting over.
+    Args:
+      version (int): The user_version the database is at once this is applied.
+      description (str): What the backfill does, for the log.
+      table (str): The table whose ids are walked.
+      statement (str): The SQL to run, given the (start, end] id range of each chunk.
+    """
+
+    def __init__(self, version: int, description: str, table: str, statement: str):
+        super().__init__(version, description, [])
+        self.table = table
+        self.statement = statement
+
+    def apply(self, conn: sqlite3.Connection, chunk_size: int, log: logging.Logger) -> None:
+        row = conn.execute(
+            "SELECT last_id FROM migration_progress WHERE version = ?", (self.version,)).fetchone()
+        last_id = row[0] if row else 0
+        max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {self.table}").fetchone()[0]
+        logged_at = time.monotonic()
+
+        def run_chunk(conn, start, end):
+            conn.execute(self.statement, (start, end))
+            conn.execute('''
+                INSERT INTO migration_progress (version, last_id) VALUES (?, ?)
+                ON CONFLICT (version) DO UPDATE SET last_id = excluded.last_id
+            ''', (self.version, end))
+
+        while last_id < max_id:
+            end = last_id + chunk_size
+            _in_transaction(conn, lambda conn: run_chunk(conn, last_id, end))
+            last_id = end
+            if time.monotonic() - logged_at > 10:
+                log.info(f"Migration {self.version}: {min(last_id, max_id)}/{max_id} rows of {self.table}")
+                logged_at = time.monotonic()
+
+        def finish(conn):
+            conn.execute("DELETE FROM migration_progress WHERE version = ?", (self.version,))
+            conn.execute(f"PRAGMA user_version = {int(self.version)};")
+        _in_transaction(conn, finish)
+
+
+# append only: a released migration must never change, add a new one instead
+MIGRATIONS = [
+    Migration(1, "Create the stats and quotes tables", ['''
+        CREATE TABLE IF NOT EXISTS command_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            user_name TEXT NOT NULL,
+            command_name TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''', '''
+        CREATE TABLE IF NOT EXISTS music_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            user_name TEXT NOT NULL,
+            media_title TEXT NOT NULL,
+            media_url TEXT NOT NULL,
+            genre TEXT DEFAULT Unknown,
+            playback_speed REAL,
+            duration REAL,
+            action TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''', '''
+        CREATE TABLE IF NOT EXISTS quotes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            user_name TEXT NOT NULL,
+            quote_title TEXT NOT NULL,
+            quote TEXT NOT NULL,
+            author TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''', '''
+        CREATE INDEX IF NOT EXISTS idx_quotes_guild_id ON quotes (guild_id)
+    '''
+    ]),
+
+    # epoch seconds, so time ranges are plain integer comparisons an index can seek on
+    Migration(2, "Add created_at epoch columns", [
+        _add_column('command_usage', 'created_at', 'INTEGER'),
+        _add_column('music_actions', 'created_at', 'INTEGER'),
+    ]),
+    Backfill(3, "Fill in command_usage.created_at", 'command_usage', '''
+        UPDATE command_usage SET created_at = CAST(strftime('%s', timestamp) AS INTEGER)
+        WHERE id > ? AND id <= ? AND created_at IS NULL
+    '''),
+    Backfill(4, "Fill in music_actions.created_at", 'music_actions', '''
+        UPDATE music_actions SET created_at = CAST(strftime('%s', timestamp) AS INTEGER)
+        WHERE id > ? AND id <= ? AND created_at IS NULL
+    '''),
+
+    # one index per migration, so an interrupted start only has to rebuild the one it was on
+    Migration(5, "Index command_usage by guild and time", ['''
+        CREATE INDEX IF NOT EXISTS idx_command_usage_guild_created ON command_usage (guild_id, created_at)
+    ''', '''
+        DROP INDEX IF EXISTS idx_command_usage_guild_id
+    '''
+    ]),
+    Migration(6, "Index music_actions by guild, action and time", ['''
+        CREATE INDEX IF NOT EXISTS idx_music_actions_guild_action_created ON music_actions (guild_id, action, created_at)
+    ''', '''
+        DROP INDEX IF EXISTS idx_music_actions_guild_action
+    ''', '''
+        DROP INDEX IF EXISTS idx_music_actions_guild_action_timestamp
+    '''
+    ]),
+    Migration(7, "Index music_actions by guild, user, action and time", ['''
+        CREATE INDEX IF NOT EXISTS idx_music_actions_guild_user_action_created ON music_actions (guild_id, user_id, action, created_at)
+    ''', '''
+        DROP INDEX IF EXISTS idx_music_actions_guild_user
+    '''
+    ]),
+
+    # usage counted per hour, so stats don't have to group the whole history on every call.
+    # the rollups are emptied and rebuilt from the raw rows, nothing else writes while migrations run
+    Migration(8, "Create the hourly command usage rollup", ['''
+        CREATE TABLE IF NOT EXISTS command_usage_hourly (
+            guild_id INTEGER NOT NULL,
+            hour_ts INTEGER NOT NULL,
+            command_name TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour_ts, command_name, user_id)
+        ) WITHOUT ROWID
+    ''', '''
+        DELETE FROM command_usage_hourly
+    ''', '''
+        DROP TRIGGER IF EXISTS command_usage_rollup
+    ''', '''
+        CREATE TRIGGER command_usage_rollup AFTER INSERT ON command_usage
+        BEGIN
+            INSERT INTO command_usage_hourly (guild_id, hour_ts, command_name, user_id, count)
+            VALUES (NEW.guild_id, NEW.created_at / 3600 * 3600, NEW.command_name, NEW.user_id, 1)
+            ON CONFLICT (guild_id, hour_ts, command_name, user_id) DO UPDATE SET count = count + 1;
+        END
+    '''
+    ]),
+    Backfill(9, "Fill in the hourly command usage rollup", 'command_usage', '''
+        INSERT INTO command_usage_hourly (guild_id, hour_ts, command_name, user_id, count)
+        SELECT guild_id, created_at / 3600 * 3600 AS hour_ts, command_name, user_id, COUNT(*)
+        FROM command_usage
+        WHERE id > ? AND id <= ?
+        GROUP BY guild_id, hour_ts, command_name, user_id
+        ON CONFLICT (guild_id, hour_ts, command_name, user_id) DO UPDATE SET count = count + excluded.count
+    '''),
+    Migration(10, "Create the hourly music actions rollup", ['''
+        CREATE TABLE IF NOT EXISTS music_actions_hourly (
+            guild_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            hour_ts INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            media_url TEXT NOT NULL,
+            media_title TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            listen_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, action, hour_ts, user_id, media_url, media_title)
+        ) WITHOUT ROWID
+    ''', '''
+        DELETE FROM music_actions_hourly
+    ''', '''
+        DROP TRIGGER IF EXISTS music_actions_rollup
+    ''', '''
+        CREATE TRIGGER music_actions_rollup AFTER INSERT ON music_actions
+        BEGIN
+            INSERT INTO music_actions_hourly (guild_id, action, hour_ts, user_id, media_url, media_title, count, listen_seconds)
+            VALUES (NEW.guild_id, NEW.action, NEW.created_at / 3600 * 3600,
+                    NEW.user_id, NEW.media_url, NEW.media_title, 1,
+                    COALESCE(NEW.playback_speed * NEW.duration, 0))
+            ON CONFLICT (guild_id, action, hour_ts, user_id, media_url, media_title) DO UPDATE
+            SET count = count + 1, listen_seconds = listen_seconds + excluded.listen_seconds;
+        END
+    '''
+    ]),
+    Backfill(11, "Fill in the hourly music actions rollup", 'music_actions', '''
+        INSERT INTO music_actions_hourly (guild_id, action, hour_ts, user_id, media_url, media_title, count, listen_seconds)
+        SELECT guild_id, action, created_at / 3600 * 3600 AS hour_ts,
+               user_id, media_url, media_title, COUNT(*), COALESCE(SUM(playback_speed * duration), 0)
+        FROM music_actions
+        WHERE id > ? AND id <= ?
+        GROUP BY guild_id, action, hour_ts, user_id, media_url, media_title
+        ON CONFLICT (guild_id, action, hour_ts, user_id, media_url, media_title) DO UPDATE
+        SET count = count + excluded.count, listen_seconds = listen_seconds + excluded.listen_seconds
+    '''),
+]
+
+
+async def migrate(db: Database, migrations: list = MIGRATIONS) -> int:
+    """
+    Brings the database schema up to date.
+    The schema version is kept in PRAGMA user_version, and every migration
+    past it is applied in order. Run it once at startup, before anything
+    else uses the database.
+    Args:
+      db (Database): The database to migrate.
+      migrations (list): The migrations, ordered by version.
+    Returns:
+      int: How many migrations were applied.
+    Examples:
+      >>> await migrate(bot.db)
+      11
+    """
+    chunk_size = db.config.get("db_migration_chunk", 50000)
+
+    def run(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS migration_progress (
+                version INTEGER PRIMARY KEY,
+                last_id INTEGER NOT NULL
+            )
+        ''')
+        version = conn.execute("PRAGMA user_version;").fetchone()[0]
+        latest = migrations[-1].version if migrations else 0
+        if version > latest:
+            db.log.warning(f"Database schema version {version} is newer than this bot knows ({latest}).")
+            return 0
+
+        applied = 0
+        for migration in migrations:
+            if migration.version <= version:
+                continue
+            started = time.monotonic()
+            db.log.info(f"Applying migration {migration.version}: {migration.description}")
+            migration.apply(conn, chunk_size, db.log)
+            db.log.debug(f"Migration {migration.version} took {time.monotonic() - started:.2f}s")
+            applied += 1
+        return applied
+
+    return await db.run(run)
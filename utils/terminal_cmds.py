@@ -384,6 +384,7 @@ def show_help(bot: commands.Bot) -> None:
         "wipebot": 'Wipes the bot"s configuration files.',
         "aliases": "Lists all command aliases.",
         "debug": "Toggles debug mode.",
+        "musicstats": "Shows music player, cache and playback stats.",
     }
 
     try:
@@ -442,6 +443,7 @@ def show_aliases(bot: commands.Bot) -> None:
         "wipebot": ["wipeconfig", "wipe", "wb"],
         "alias": ["aliases", "a"],
         "debug": ["d"],
+        "musicstats": ["ms"],
     }
 
     try:
@@ -467,6 +469,35 @@ def show_aliases(bot: commands.Bot) -> None:
         traceback.print_exc()
 
 
+def show_music_stats(bot: commands.Bot) -> None:
+    """
+    Prints the music player registry, cache and playback stats.
+    Args:
+      bot (Bot): The bot instance.
+    Side Effects:
+      Prints the stats to the console.
+    Examples:
+      >>> show_music_stats(bot)
+    """
+    try:
+        music_cog = bot.get_cog("MusicCog")
+        if music_cog is None:
+            return bot.log.info("The music cog is not loaded.")
+
+        manager = music_cog.music_manager
+        sections = {
+            "Players": manager.stats(),
+            "Track cache": manager.resolver.cache.stats(),
+            "Player embeds": manager.progress.stats(),
+            "Playback": manager.metrics.stats(),
+        }
+        for name, stats in sections.items():
+            values = ", ".join(f"{key}={value}" for key, value in stats.items())
+            bot.log.info(f"{name}: {values}")
+    except Exception as e:
+        bot.log.error(f"Error in show_music_stats function: {str(e)}")
+
+
 def ping(bot: commands.Bot) -> None:
     """
     Prints 'Pong!' to the console.
@@ -5,12 +5,14 @@ import numpy as np
 import json
 import traceback
 import asyncio
+import time
 from discord.ext import commands
 from discord import Forbidden, HTTPException, NotFound
 from io import BytesIO
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Callable
+from utils.logger import log_error
 
 
 async def welcome_to_bot(bot: commands.Bot) -> None:
@@ -79,6 +81,40 @@ def get_new_config():
           "max_media_duration": 3600,
           "media_volume": 10,
           "music_channel_ids": ["", ""],
+          "extractor_workers": 4,
+          "extractor_timeout": 30,
+          "extractor_max_pending": 16,
+          "extractor_mode": "thread",
+          "track_cache_size": 512,
+          "track_metadata_ttl": 86400,
+          "track_stream_ttl": 3600,
+          "prefetch_depth": 2,
+          "gapless_handover_lead": 5,
+          "opus_passthrough": True,
+          "queue_capacity": 100,
+          "queue_fair_mode": False,
+          "playlist_chunk_size": 25,
+          "player_idle_ttl": 600,
+          "player_sweep_interval": 60,
+          "voice_connect_timeout": 15,
+          "voice_keep_warm": 0,
+          "music_snapshot_interval": 30,
+          "music_snapshot_max_age": 900,
+          "progress_interval": 5,
+          "progress_max_interval": 30,
+          "progress_concurrency": 4,
+          "audio_cache_enabled": True,
+          "audio_cache_max_mb": 1024,
+          "audio_cache_min_requests": 3,
+          "audio_cache_max_track_duration": 1200,
+          "audio_cache_render_speeds": True,
+          "db_cache_kb": 16384,
+          "db_mmap_size": 268435456,
+          "db_statement_cache": 256,
+          "db_batch_size": 200,
+          "db_batch_interval": 5,
+          "db_batch_capacity": 5000,
+          "db_migration_chunk": 50000,
           "log_level": "INFO",
           "update_bot": True,
       }
@@ -93,6 +129,40 @@ def get_new_config():
         "max_media_duration": 3600,
         "media_volume": 10,
         "music_channel_ids": [int(input("Music Channel ID: ")), 12345678],
+        "extractor_workers": 4,
+        "extractor_timeout": 30,
+        "extractor_max_pending": 16,
+        "extractor_mode": "thread",
+        "track_cache_size": 512,
+        "track_metadata_ttl": 86400,
+        "track_stream_ttl": 3600,
+        "prefetch_depth": 2,
+        "gapless_handover_lead": 5,
+        "opus_passthrough": True,
+        "queue_capacity": 100,
+        "queue_fair_mode": False,
+        "playlist_chunk_size": 25,
+        "player_idle_ttl": 600,
+        "player_sweep_interval": 60,
+        "voice_connect_timeout": 15,
+        "voice_keep_warm": 0,
+        "music_snapshot_interval": 30,
+        "music_snapshot_max_age": 900,
+        "progress_interval": 5,
+        "progress_max_interval": 30,
+        "progress_concurrency": 4,
+        "audio_cache_enabled": True,
+        "audio_cache_max_mb": 1024,
+        "audio_cache_min_requests": 3,
+        "audio_cache_max_track_duration": 1200,
+        "audio_cache_render_speeds": True,
+        "db_cache_kb": 16384,
+        "db_mmap_size": 268435456,
+        "db_statement_cache": 256,
+        "db_batch_size": 200,
+        "db_batch_interval": 5,
+        "db_batch_capacity": 5000,
+        "db_migration_chunk": 50000,
         "log_level": "INFO",
         "update_bot": True,
     }
@@ -283,6 +353,30 @@ def format_time(seconds):
         return f"{minutes}:{secs:02d}"
 
 
+def timeframe_start(timeframe: str) -> int:
+    """
+    Returns where a stats timeframe starts, as a UTC epoch timestamp.
+    Every start falls on midnight UTC, so it lines up with the hourly rollups.
+
+    Args:
+        timeframe (str): One of 'all', 'today', 'week' or 'month'.
+
+    Returns:
+        int: The epoch second the timeframe starts at, or None for 'all'.
+
+    Examples:
+        >>> timeframe_start('today')
+        1718841600
+        >>> timeframe_start('all') is None
+        True
+    """
+    today = int(time.time()) // 86400 * 86400
+    days = {'today': 0, 'week': 7, 'month': 30}.get(timeframe)
+    if days is None:
+        return None
+    return today - days * 86400
+
+
 async def generate_bar_chart(ctx, data, title=None, xlabel=None, ylabel=None, group='song'):
     """
     Generates a bar chart from the given data and sends it to the channel.
@@ -417,6 +511,64 @@ def generate_progress_bar(progress_percentage):
     return "▰" * filled_bars + "▱" * (total_bars - filled_bars)
 
 
+# guild id -> connect that is still in progress, so concurrent commands share it
+_pending_connects = {}
+
+
+async def _wait_until_connected(voice_client, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not voice_client.is_connected():
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(0.25)
+    return True
+
+
+async def connect_voice(bot: commands.Bot, voice_channel) -> discord.VoiceClient:
+    """
+    Connects to a voice channel, reusing the guild's existing connection.
+    Concurrent calls for the same guild wait on a single connect instead of
+    racing each other, a dropped connection gets a bounded wait for
+    discord.py to reconnect it, and is torn down instead of handed out if
+    it doesn't come back.
+    Args:
+        bot (Bot): The bot instance.
+        voice_channel (VoiceChannel): The voice channel to be in.
+    Returns:
+        VoiceClient: The voice client.
+    Examples:
+        >>> await connect_voice(bot, ctx.author.voice.channel)
+    """
+    guild = voice_channel.guild
+    timeout = bot.config.get('voice_connect_timeout', 15)
+
+    # the voice client is registered before its handshake finishes, so check for a connect in flight first
+    task = _pending_connects.get(guild.id)
+    if task is not None:
+        # one caller giving up must not cancel the connect for everyone else
+        voice_client = await asyncio.shield(task)
+    else:
+        voice_client = guild.voice_client
+
+    if voice_client is not None and not voice_client.is_connected():
+        # discord.py may still be reconnecting it on its own, there is no public way to tell
+        if not await _wait_until_connected(voice_client, timeout):
+            await voice_client.disconnect(force=True)
+            voice_client = None
+
+    if voice_client is not None:
+        if voice_client.channel != voice_channel:
+            await voice_client.move_to(voice_channel)
+        return voice_client
+
+    task = _pending_connects.get(guild.id)
+    if task is None:
+        task = asyncio.ensure_future(voice_channel.connect(timeout=timeout))
+        _pending_connects[guild.id] = task
+        task.add_done_callback(lambda _: _pending_connects.pop(guild.id, None))
+    return await asyncio.shield(task)
+
+
 async def join_voice_channel(bot: commands.Bot, ctx, allowed_text_channels: list):
     """
     Joins the voice channel of the user.
@@ -436,25 +588,15 @@ async def join_voice_channel(bot: commands.Bot, ctx, allowed_text_channels: list
         await ctx.send("You need type in the music chat to use this command!", delete_after=12)
         return None
 
-    voice_channel = ctx.author.voice.channel
-    voice_client = discord.utils.get(
-        bot.voice_clients, guild=ctx.guild)
-
-    if voice_client is None:
-        try:
-            voice_client = await voice_channel.connect()
-        except Exception as e:
-            await ctx.send(f"An unexpected error occurred:\n{str(e)}\n\nReport this to your server admin if you think this is a bug.")
-            log_error(
-                bot, f"Unexpected error in join_voice_channel: {str(e)}")
-            return None
-    elif voice_client.channel != voice_channel:
-        try:
-            await voice_client.move_to(voice_channel)
-        except Exception as e:
-            await ctx.send(f"An unexpected error occurred:\n{str(e)}\n\nReport this to your server admin if you think this is a bug.")
-            log_error(
-                bot, f"Unexpected error in join_voice_channel: {str(e)}")
-            return None
-
-    return voice_client
+    try:
+        return await connect_voice(bot, ctx.author.voice.channel)
+    except asyncio.TimeoutError:
+        await ctx.send("Connecting to the voice channel took too long. Try again in a bit.", delete_after=12)
+        log_error(
+            bot, f"Timed out connecting to voice in guild '{ctx.guild.name}'")
+        return None
+    except Exception as e:
+        await ctx.send(f"An unexpected error occurred:\n{str(e)}\n\nReport this to your server admin if you think this is a bug.")
+        log_error(
+            bot, f"Unexpected error in join_voice_channel: {str(e)}")
+        return None